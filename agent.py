@@ -4,12 +4,12 @@ import time
 import random
 from collections import defaultdict
 from minesweeper import MinesweeperDiscreetEnv
-from constraints import generate_constraints
+from constraints import generate_constraints, reduce_constraints, linear_deductions, split_components, guess_probabilities
 from constants import CLOSED, FLAG, MINE
 
 # csp solver logic
 
-def solve_csp(board_state):
+def solve_csp(board_state, count_only=True, stats=None):
     board_size = board_state.shape[0]
     
     # get constraints from helper
@@ -18,57 +18,42 @@ def solve_csp(board_state):
     if not all_constraints:
         return set(), set()
 
-    # map variables to constraints
-    var_to_constraints = defaultdict(list)
-    all_vars = set()
-    
-    for i, (vars_in_constraint, needed) in enumerate(all_constraints):
-        for v in vars_in_constraint:
-            var_to_constraints[v].append(i)
-            all_vars.add(v)
+    # trivial and subset rules first, no search needed
+    safe_moves, flag_moves, residual = reduce_constraints(all_constraints)
+    deduced = len(safe_moves) + len(flag_moves)
+    if stats is not None:
+        stats["deduction"] += deduced
+
+    # then Gaussian elimination, polynomial even where the search would hit its cap
+    linear_safe, linear_flags, residual = linear_deductions(residual)
+    safe_moves |= linear_safe
+    flag_moves |= linear_flags
+    if stats is not None:
+        stats["linear"] += len(linear_safe) + len(linear_flags)
+    deduced = len(safe_moves) + len(flag_moves)
+
+    # search the independent components that are left
+    for comp_vars, comp_constraints in split_components(residual):
+        # count mines per cell during the search, nothing stored
+        if count_only:
+            total, mine_counts, _, capped = count_solutions(comp_vars, comp_constraints)
             
-    # find connected components
-    components = []
-    visited = set()
-    
-    for v in all_vars:
-        if v in visited:
+            # a capped count only saw some of the solutions
+            if not total or capped:
+                continue
+
+            for v in comp_vars:
+                if mine_counts[v] == 0:
+                    safe_moves.add(v)
+                if mine_counts[v] == total:
+                    flag_moves.add(v)
             continue
-            
-        # bfs to group interacting vars
-        component_vars = set([v])
-        q = [v]
-        visited.add(v)
-        
-        while q:
-            curr = q.pop(0)
-            for c_idx in var_to_constraints[curr]:
-                c_vars, _ = all_constraints[c_idx]
-                for neighbor in c_vars:
-                    if neighbor not in visited:
-                        visited.add(neighbor)
-                        component_vars.add(neighbor)
-                        q.append(neighbor)
-        components.append(list(component_vars))
-
-    # solve independent components
-    safe_moves = set()
-    flag_moves = set()
-    
-    for comp_vars in components:
-        # filter relevant constraints
-        comp_constraints = []
-        seen_constraint_indices = set()
-        for v in comp_vars:
-            for c_idx in var_to_constraints[v]:
-                if c_idx not in seen_constraint_indices:
-                    seen_constraint_indices.add(c_idx)
-                    comp_constraints.append(all_constraints[c_idx])
         
         # run backtracking solver
         solutions = backtracking_solve(comp_vars, comp_constraints)
         
-        if not solutions:
+        # past the cap the list is only some of the solutions, same as a capped count
+        if not solutions or len(solutions) > 1000:
             continue
 
         # check for certainties across all solutions
@@ -85,10 +70,39 @@ def solve_csp(board_state):
             if can_be_mine and not can_be_safe:
                 flag_moves.add(v)
 
+    if stats is not None:
+        stats["search"] += len(safe_moves) + len(flag_moves) - deduced
     return safe_moves, flag_moves
 
 def backtracking_solve(variables, constraints):
     solutions = []
+    _search(variables, constraints, lambda assignment: solutions.append(assignment.copy()))
+    return solutions
+
+def count_solutions(variables, constraints):
+    # tallies instead of solutions: (number of solutions,
+    # mines per variable, {mines in solution: (solutions, mines per variable)},
+    # whether the search hit its cap)
+    mine_counts = dict.fromkeys(variables, 0)
+    histogram = {}
+
+    def tally(assignment):
+        mines = [v for v, val in assignment.items() if val]
+        if len(mines) not in histogram:
+            histogram[len(mines)] = [0, dict.fromkeys(variables, 0)]
+        entry = histogram[len(mines)]
+        entry[0] += 1
+        for v in mines:
+            mine_counts[v] += 1
+            entry[1][v] += 1
+
+    total, capped = _search(variables, constraints, tally)
+    return total, mine_counts, {k: tuple(entry) for k, entry in histogram.items()}, capped
+
+def _search(variables, constraints, on_solution):
+    # backtracking over the variables, on_solution gets each valid assignment.
+    # returns (solutions found, whether the cap cut the search short)
+    found = 0
     
     # sort variables by most constrained
     var_counts = defaultdict(int)
@@ -98,45 +112,58 @@ def backtracking_solve(variables, constraints):
     
     assignment = {} 
 
-    def is_valid(assignment):
-        for v_list, limit in constraints:
-            current_sum = 0
-            unassigned = 0
-            for v in v_list:
-                if v in assignment:
-                    current_sum += assignment[v]
-                else:
-                    unassigned += 1
-            
+    # per-constraint mines placed and cells left, only updated for
+    # the constraints of the variable being assigned
+    limits = [limit for _, limit in constraints]
+    placed = [0] * len(constraints)
+    unassigned = [len(v_list) for v_list, _ in constraints]
+    var_to_constraints = defaultdict(list)
+    for i, (v_list, _) in enumerate(constraints):
+        for v in v_list:
+            var_to_constraints[v].append(i)
+
+    def fits(touched, val):
+        for c in touched:
             # too many mines
-            if current_sum > limit: 
+            if placed[c] + val > limits[c]:
                 return False
             # not enough space for required mines
-            if current_sum + unassigned < limit:
+            if placed[c] + val + unassigned[c] < limits[c]:
                 return False
         return True
 
     def backtrack(idx):
+        nonlocal found
         # cap max solutions
-        if len(solutions) > 1000: 
+        if found > 1000: 
             return
 
         if idx == len(variables):
-            solutions.append(assignment.copy())
+            found += 1
+            on_solution(assignment)
             return
 
         curr_var = variables[idx]
+        touched = var_to_constraints[curr_var]
+        for c in touched:
+            unassigned[c] -= 1
         
         # try 0 (safe) and 1 (mine)
         for val in [0, 1]:
-            assignment[curr_var] = val
-            if is_valid(assignment):
+            if fits(touched, val):
+                assignment[curr_var] = val
+                for c in touched:
+                    placed[c] += val
                 backtrack(idx + 1)
+                for c in touched:
+                    placed[c] -= val
         
-        del assignment[curr_var]
+        for c in touched:
+            unassigned[c] += 1
+        assignment.pop(curr_var, None)
 
     backtrack(0)
-    return solutions
+    return found, found > 1000
 
 # main game loop
 
@@ -162,33 +189,31 @@ def run_agent_game():
         
         made_move = False
         
-        # execute flags
-        for (r, c) in flags:
-            if observation[r, c] == CLOSED:
-                print(f"CSP says FLAG: ({r},{c})")
-                env.toggle_flag(r, c)
-                made_move = True
+        # execute flags and safe moves as one batch
+        flag_cells = [(r, c) for (r, c) in flags if observation[r, c] == CLOSED]
+        safe_cells = [(r, c) for (r, c) in safe if observation[r, c] == CLOSED]
+        for (r, c) in flag_cells: print(f"CSP says FLAG: ({r},{c})")
+        for (r, c) in safe_cells: print(f"CSP says SAFE: ({r},{c})")
         
-        # execute safe moves
-        for (r, c) in safe:
-            if observation[r, c] == CLOSED:
-                print(f"CSP says SAFE: ({r},{c})")
-                action = r * env.board_size + c
-                observation, _, done, _, _ = env.step(action)
-                made_move = True
-                if done: break
+        if flag_cells or safe_cells:
+            observation, _, done, _, info = env.step_many(safe_cells, flag_cells)
+            env.render()
+            made_move = True
         
         # guess if stuck
         if not made_move and not done:
             print("CSP found no guaranteed moves. Guessing...")
-            closed_r, closed_c = np.where(observation == CLOSED)
-            if len(closed_r) == 0: break
+            closed_actions = np.flatnonzero(info["action_mask"])
+            if len(closed_actions) == 0: break
             
-            idx = random.randint(0, len(closed_r) - 1)
-            r, c = closed_r[idx], closed_c[idx]
+            # safest closed cell by mine probability, random among ties
+            probabilities = guess_probabilities(observation, env.num_mines, count_solutions).ravel()[closed_actions]
+            best = closed_actions[probabilities <= probabilities.min() + 1e-9]
+            idx = random.randint(0, len(best) - 1)
+            r, c = divmod(int(best[idx]), env.board_size)
             
-            print(f"Guessing: ({r},{c})")
-            observation, _, done, _, _ = env.step(r * env.board_size + c)
+            print(f"Guessing: ({r},{c}), mine probability {probabilities.min():.2f}")
+            observation, _, done, _, info = env.step(r * env.board_size + c)
 
     print("\n--- GAME OVER ---")
     print(f"Result: {env.game_over_status}")
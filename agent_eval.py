@@ -4,14 +4,15 @@ import random
 import matplotlib.pyplot as plt
 import pandas as pd
 from collections import defaultdict
-from minesweeper import MinesweeperDiscreetEnv, is_valid
+from minesweeper import MinesweeperDiscreetEnv
 from constants import CLOSED, FLAG
-from constraints import generate_constraints
+from constraints import generate_constraints, reduce_constraints, linear_deductions, split_components, guess_probabilities
 
 # config
 RENDER_DELAY = 0.1 # delay between moves
+REPLAY_LOG = None  # e.g. "eval_games.msr": append every game to this log, play it back with replay.py
 
-def solve_csp(board_state):
+def solve_csp(board_state, count_only=True, stats=None):
     board_size = board_state.shape[0]
     
     # 1. generate constraints based on revealed numbers
@@ -20,56 +21,33 @@ def solve_csp(board_state):
     if not all_constraints:
         return set(), set()
 
-    # 2. map variables (hidden cells) to the constraints they belong to
-    var_to_constraints = defaultdict(list)
-    all_vars = set()
-    
-    for i, (vars_in_constraint, needed) in enumerate(all_constraints):
-        for v in vars_in_constraint:
-            var_to_constraints[v].append(i)
-            all_vars.add(v)
-            
-    # 3. find connected components (groups of variables that interact)
-    # variables are connected if they share a constraint
-    components = []
-    visited = set()
-    
-    for v in all_vars:
-        if v in visited: continue
-            
-        # bfs to gather all connected variables for this component
-        component_vars = set([v])
-        q = [v]
-        visited.add(v)
-        
-        while q:
-            curr = q.pop(0)
-            for c_idx in var_to_constraints[curr]:
-                c_vars, _ = all_constraints[c_idx]
-                for neighbor in c_vars:
-                    if neighbor not in visited:
-                        visited.add(neighbor)
-                        component_vars.add(neighbor)
-                        q.append(neighbor)
-        components.append(list(component_vars))
-
-    # 4. solve each component independently
-    safe_moves = set()
-    flag_moves = set()
-    
-    for comp_vars in components:
-        # gather only the constraints relevant to this specific component
-        comp_constraints = []
-        seen_constraint_indices = set()
-        for v in comp_vars:
-            for c_idx in var_to_constraints[v]:
-                if c_idx not in seen_constraint_indices:
-                    seen_constraint_indices.add(c_idx)
-                    comp_constraints.append(all_constraints[c_idx])
-        
+    # 2. cheap deductions first (trivial and subset rules), they settle most cells
+    safe_moves, flag_moves, residual = reduce_constraints(all_constraints)
+    if stats is not None: stats["deduction"] += len(safe_moves) + len(flag_moves)
+
+    # 3. Gaussian elimination over what is left: polynomial time, so it also settles
+    # cells in components far too big to search
+    linear_safe, linear_flags, residual = linear_deductions(residual)
+    safe_moves |= linear_safe
+    flag_moves |= linear_flags
+    if stats is not None: stats["linear"] += len(linear_safe) + len(linear_flags)
+    found_without_search = len(safe_moves) + len(flag_moves)
+
+    # 4. split what is left into connected components (cells are connected
+    # if they share a constraint) and search each one independently
+    for comp_vars, comp_constraints in split_components(residual):
+        # count_only: tally mines per cell over the valid arrangements as the search finds them
+        if count_only:
+            total, mine_counts, _, capped = count_solutions(comp_vars, comp_constraints)
+            if not total or capped: continue # a capped tally proves nothing
+            for v in comp_vars:
+                if mine_counts[v] == 0: safe_moves.add(v) # never a mine -> guaranteed safe
+                if mine_counts[v] == total: flag_moves.add(v) # always a mine -> guaranteed mine
+            continue
+
         # find all valid mine arrangements for this component
         solutions = backtracking_solve(comp_vars, comp_constraints)
-        if not solutions: continue
+        if not solutions or len(solutions) > 1000: continue # capped, like the count path
 
         # check for unanimous agreement across all solutions
         for i, v in enumerate(comp_vars):
@@ -85,10 +63,38 @@ def solve_csp(board_state):
             # if it CAN be mine but NEVER safe -> guaranteed mine
             if can_be_mine and not can_be_safe: flag_moves.add(v)
 
+    if stats is not None: stats["search"] += len(safe_moves) + len(flag_moves) - found_without_search
     return safe_moves, flag_moves
 
 def backtracking_solve(variables, constraints):
     solutions = []
+    _search(variables, constraints, lambda assignment: solutions.append(assignment.copy()))
+    return solutions
+
+def count_solutions(variables, constraints):
+    # same search as backtracking_solve, but nothing is stored: returns the number of
+    # solutions, how many put a mine on each variable, per mine total k the number of
+    # solutions with k mines and their mines per variable (k -> (count, {v: mines})),
+    # and whether the search stopped at its solution cap (then the tallies are partial)
+    mine_counts = dict.fromkeys(variables, 0)
+    histogram = {}
+
+    def tally(assignment):
+        mines = [v for v, val in assignment.items() if val]
+        if len(mines) not in histogram: histogram[len(mines)] = [0, dict.fromkeys(variables, 0)]
+        entry = histogram[len(mines)]
+        entry[0] += 1
+        for v in mines:
+            mine_counts[v] += 1
+            entry[1][v] += 1
+
+    total, capped = _search(variables, constraints, tally)
+    return total, mine_counts, {k: tuple(entry) for k, entry in histogram.items()}, capped
+
+def _search(variables, constraints, on_solution):
+    # calls on_solution(assignment) for every valid assignment, returns how many there were
+    # and whether it gave up at the cap before finding them all
+    found = 0
     
     # heuristic: sort variables by how many constraints they appear in
     # this causes conflicts to happen earlier, pruning the tree faster
@@ -99,49 +105,61 @@ def backtracking_solve(variables, constraints):
     
     assignment = {} 
 
-    def is_valid(assignment):
-        # check if current assignment violates any constraint
-        for v_list, limit in constraints:
-            current_sum = 0
-            unassigned = 0
-            for v in v_list:
-                if v in assignment: current_sum += assignment[v]
-                else: unassigned += 1
-            
+    # running totals per constraint: mines placed and cells still unassigned.
+    # assigning a variable only touches the constraints it is in, so a node
+    # costs the variable's degree instead of a scan of every constraint
+    limits = [limit for _, limit in constraints]
+    placed = [0] * len(constraints)
+    unassigned = [len(v_list) for v_list, _ in constraints]
+    var_to_constraints = defaultdict(list)
+    for i, (v_list, _) in enumerate(constraints):
+        for v in v_list: var_to_constraints[v].append(i)
+
+    def fits(touched, val):
+        # check the constraints of the variable being assigned
+        for c in touched:
             # violation 1: placed mines exceed the number on the board
-            if current_sum > limit: return False
+            if placed[c] + val > limits[c]: return False
             # violation 2: remaining empty spots aren't enough to satisfy the number
-            if current_sum + unassigned < limit: return False
+            if placed[c] + val + unassigned[c] < limits[c]: return False
         return True
 
     def backtrack(idx):
+        nonlocal found
         # limit solutions to prevent hanging on large open areas
-        if len(solutions) > 1000: return
+        if found > 1000: return
         
         # base case: all variables assigned successfully
         if idx == len(variables):
-            solutions.append(assignment.copy())
+            found += 1
+            on_solution(assignment)
             return
 
         curr_var = variables[idx]
+        touched = var_to_constraints[curr_var]
+        for c in touched: unassigned[c] -= 1
         # try assigning 0 (safe) then 1 (mine)
         for val in [0, 1]:
-            assignment[curr_var] = val
-            if is_valid(assignment): backtrack(idx + 1)
-        del assignment[curr_var]
+            if fits(touched, val):
+                assignment[curr_var] = val
+                for c in touched: placed[c] += val
+                backtrack(idx + 1)
+                for c in touched: placed[c] -= val
+        for c in touched: unassigned[c] += 1
+        assignment.pop(curr_var, None)
 
     backtrack(0)
-    return solutions
+    return found, found > 1000
 
 # --- EVALUATION ---
 
 def run_single_eval_game():
-    env = MinesweeperDiscreetEnv(render_mode="human")
+    env = MinesweeperDiscreetEnv(render_mode="human", record_path=REPLAY_LOG)
     observation, info = env.reset()
-    board_state = observation
     done = False
     good_moves = 0
     total_clicks = 0 
+    tiers = {"deduction": 0, "linear": 0, "search": 0, "guess": 0} # cells settled by each tier
 
     # track start time
     start_time = time.time()
@@ -166,40 +184,35 @@ def run_single_eval_game():
         # logic loop: keep applying logic until stuck
         while made_logic_move and not done:
             made_logic_move = False
-            safe, flags = solve_csp(observation)
+            safe, flags = solve_csp(observation, stats=tiers)
             
             if safe or flags:
                 made_logic_move = True
                 
-                # 1. apply guaranteed flags (csp said 'always mine')
-                for (r, c) in flags:
-                    if observation[r, c] == CLOSED: 
-                        env.toggle_flag(r, c)
-                        if env.render_mode == "human": # pause after flag
-                            env.render()
-                            time.sleep(RENDER_DELAY)
+                # apply guaranteed flags (csp said 'always mine') and safe moves
+                # (csp said 'always safe') in one env call
+                flag_cells = [(r, c) for (r, c) in flags if observation[r, c] == CLOSED]
+                safe_cells = [(r, c) for (r, c) in safe if observation[r, c] == CLOSED]
+                observation, reward, done, truncated, info = env.step_many(safe_cells, flag_cells)
+                env.total_reward += reward # update score manually
+                good_moves += info["reveals_applied"]
                 
-                # 2. apply guaranteed safe moves (csp said 'always safe')
-                for (r, c) in safe:
-                    if observation[r, c] == CLOSED and not done:
-                        action = r * env.board_size + c
-                        observation, reward, done, truncated, info = env.step(action)
-                        env.total_reward += reward # update score manually
-                        
-                        if not done or env.game_over_status == "win": good_moves += 1
-                        
-                        if env.render_mode == "human": # pause after safe move
-                            env.render()
-                            time.sleep(RENDER_DELAY)
+                if env.render_mode == "human": # pause after each batch
+                    env.render()
+                    time.sleep(RENDER_DELAY)
 
         # 3. logic failed? forced to guess
         if not done:
-            closed_r, closed_c = np.where(board_state == CLOSED)
-            if len(closed_r) == 0: break
+            # the env keeps a mask of still-closed cells, no need to rescan the board
+            closed_actions = np.flatnonzero(info["action_mask"])
+            if len(closed_actions) == 0: break
             
-            # pick a random closed cell
-            random_index = random.randint(0, len(closed_r) - 1)
-            guess_action = closed_r[random_index] * env.board_size + closed_c[random_index]
+            # pick the closed cell least likely to be a mine (a random one among ties)
+            probabilities = guess_probabilities(observation, env.num_mines, count_solutions).ravel()[closed_actions]
+            best = closed_actions[probabilities <= probabilities.min() + 1e-9]
+            random_index = random.randint(0, len(best) - 1)
+            guess_action = best[random_index]
+            tiers["guess"] += 1
             observation, reward, done, truncated, info = env.step(guess_action)
             env.total_reward += reward # update score manually
             
@@ -219,6 +232,7 @@ def run_single_eval_game():
         'won': won,
         'good_moves': good_moves,
         'elapsed_time': elapsed_time,
+        'tiers': tiers,
     }
 
 def run_evaluation(num_games=5): # reduced count for human viewing
@@ -239,6 +253,9 @@ def run_evaluation(num_games=5): # reduced count for human viewing
     won_results = [r for r in results if r['won']]
     avg_time_to_win = np.mean([r['elapsed_time'] for r in won_results]) if won_results else 0
 
+    # how the moves were found, summed over all games
+    tiers = {tier: sum(r['tiers'][tier] for r in results) for tier in results[0]['tiers']}
+
     return {
         'num_games': num_games,
         'wins': wins,
@@ -246,7 +263,8 @@ def run_evaluation(num_games=5): # reduced count for human viewing
         'win_rate': win_rate,
         'avg_time_to_win': avg_time_to_win,
         'good_moves_in_losses': good_moves_in_losses,
-        'avg_good_moves_when_lost': np.mean(good_moves_in_losses) if good_moves_in_losses else 0
+        'avg_good_moves_when_lost': np.mean(good_moves_in_losses) if good_moves_in_losses else 0,
+        'tiers': tiers,
     }
 
 def print_results(stats):
@@ -258,6 +276,9 @@ def print_results(stats):
         print(f"Avg Time to Win: {stats['avg_time_to_win']:.2f} seconds")
     if stats['losses'] > 0:
         print(f"Avg Good Moves Before Dying: {stats['avg_good_moves_when_lost']:.2f}")
+    total_moves = sum(stats['tiers'].values())
+    if total_moves > 0:
+        print("Moves by Tier: " + ", ".join(f"{tier} {count / total_moves * 100:.1f}%" for tier, count in stats['tiers'].items()))
 
 def make_graphs(stats):
     try:
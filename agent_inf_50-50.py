@@ -6,6 +6,8 @@ from tkinter import simpledialog
 from statistics import mean
 import matplotlib.pyplot as plt
 from minesweeper import MinesweeperInfiniteEnv
+from constants import CLOSED, FLAG
+from constraints import linear_deductions
 
 # config
 SOLVER_MAX_SOLUTIONS = 50 
@@ -14,7 +16,6 @@ MAX_LOCAL_SEARCHES = 3
 
 # setup
 NEIGHBOR_DELTAS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
-sys.setrecursionlimit(5000)
 
 # cache
 frontier_cells = set()
@@ -93,6 +94,15 @@ def get_local_chunk(env):
     if not hidden_frontier: return None, []
     
     seed = random.choice(hidden_frontier)
+
+    # pull the visible state around the seed in one call. The component grows at most
+    # CHUNK_SIZE cells from the seed, its numbers sit one further out and their neighbours two
+    radius = CHUNK_SIZE + 2
+    r0, c0 = seed[0] - radius, seed[1] - radius
+    window = env.get_window(r0, c0, 2 * radius + 1, 2 * radius + 1).tolist()
+
+    def value(cell):
+        return window[cell[0] - r0][cell[1] - c0]
     
     chunk_vars = {seed}
     q = [seed]
@@ -100,7 +110,7 @@ def get_local_chunk(env):
     while q and len(chunk_vars) < CHUNK_SIZE:
         curr = q.pop(0)
         for n in get_neighbors(*curr):
-            if n in frontier_cells and n not in env.revealed and n not in chunk_vars:
+            if n in frontier_cells and value(n) in (CLOSED, FLAG) and n not in chunk_vars:
                 chunk_vars.add(n)
                 q.append(n)
     
@@ -111,18 +121,19 @@ def get_local_chunk(env):
     relevant_numbers = set()
     for cv in chunk_list:
         for n in get_neighbors(*cv):
-            if n in env.revealed: relevant_numbers.add(n)
+            if value(n) >= 0: relevant_numbers.add(n)
             
     for r, c in relevant_numbers:
-        val = env.revealed[(r, c)]
+        val = value((r, c))
         unknowns = []
         flag_count = 0
         fully_contained = True
         
         for nr, nc in get_neighbors(r, c):
-            if (nr, nc) in env.flags: 
+            neighbor = value((nr, nc))
+            if neighbor == FLAG: 
                 flag_count += 1
-            elif (nr, nc) not in env.revealed:
+            elif neighbor == CLOSED:
                 if (nr, nc) in chunk_set:
                     unknowns.append(chunk_list.index((nr, nc)))
                 else:
@@ -133,8 +144,10 @@ def get_local_chunk(env):
             
     return chunk_list, constraints
 
-def solve_component_smart(coords, constraints):
-    if not constraints: return [] 
+def solve_component_smart(coords, constraints, count_only=False):
+    # valid assignments as tuples in coords order (at most SOLVER_MAX_SOLUTIONS of them).
+    # count_only stores none and returns (solutions, mines per coord, {mines: solutions}) instead
+    if not constraints: return (0, [0] * len(coords), {}) if count_only else []
     
     n = len(coords)
     var_counts = [0] * n
@@ -153,11 +166,24 @@ def solve_component_smart(coords, constraints):
         for v in vars: var_to_cons[v].append((needed, vars))
 
     solutions = []
+    found = 0
+    mine_counts = [0] * n
+    histogram = {}
     assignment = [-1] * n
 
     def solve(idx):
-        if len(solutions) >= SOLVER_MAX_SOLUTIONS: return
+        nonlocal found
+        if found >= SOLVER_MAX_SOLUTIONS: return
         if idx == n:
+            found += 1
+            if count_only:
+                mines = 0
+                for new_i, val in enumerate(assignment):
+                    if val:
+                        mine_counts[sorted_indices[new_i]] += 1
+                        mines += 1
+                histogram[mines] = histogram.get(mines, 0) + 1
+                return
             original_order_sol = [0] * n
             for new_i, val in enumerate(assignment):
                 original_order_sol[sorted_indices[new_i]] = val
@@ -182,9 +208,10 @@ def solve_component_smart(coords, constraints):
             
             if valid:
                 solve(idx + 1)
-                if len(solutions) >= SOLVER_MAX_SOLUTIONS: return
+                if found >= SOLVER_MAX_SOLUTIONS: return
         assignment[idx] = -1
     solve(0)
+    if count_only: return found, mine_counts, histogram
     return solutions
 
 def solve_local(env):
@@ -192,13 +219,13 @@ def solve_local(env):
         coords, constraints = get_local_chunk(env)
         if not coords or not constraints: continue
         
-        sols = solve_component_smart(coords, constraints)
-        if not sols: continue
+        # Gaussian elimination first: polynomial, and certain even where the search gives up
+        safe, flag, _ = linear_deductions([([coords[i] for i in vars], needed) for needed, vars in constraints])
+        if safe or flag: return safe, flag
         
-        total = len(sols)
-        counts = [0] * len(coords)
-        for s in sols:
-            for i, val in enumerate(s): counts[i] += val
+        # mines per cell tallied during the search, no solutions kept
+        total, counts, _ = solve_component_smart(coords, constraints, count_only=True)
+        if not total: continue
         
         safe = set()
         flag = set()
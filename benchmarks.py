@@ -0,0 +1,276 @@
+import copy
+import sys
+import threading
+import time
+import tracemalloc
+import numpy as np
+from constants import CLOSED, FLAG, MINE
+from collections import defaultdict
+from constraints import NEIGHBOR_OFFSETS, generate_constraints, split_components
+from minesweeper import ArrayEngine, MinesweeperDiscreetEnv, MinesweeperInfiniteEnv
+from agent_eval import backtracking_solve, count_solutions
+from bitboard import BitboardEngine
+from ring_world import RingWorld
+
+# quick timing harness for the env internals, run with: python benchmarks.py
+
+def _dirty_cells(cells, height, width):
+    # the opened cells plus their neighbours, as the env refreshes constraints
+    rows, cols = np.divmod(cells, width)
+    offsets = np.vstack([NEIGHBOR_OFFSETS, [(0, 0)]])
+    rows = (rows[:, None] + offsets[:, 0]).ravel()
+    cols = (cols[:, None] + offsets[:, 1]).ravel()
+    inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+    return np.unique(rows[inside] * width + cols[inside])
+
+def _play_engine(engine_cls, board, clicks):
+    # build the engine, then click every safe cell once, refreshing constraints after each reveal
+    height, width = board.shape
+    my_board = np.full(board.shape, CLOSED, dtype=int)
+    engine = engine_cls(board)
+    for cell in clicks:
+        x, y = divmod(int(cell), width)
+        if my_board[x, y] != CLOSED: continue
+        opened = engine.reveal(my_board, x, y)
+        engine.constraint_arrays(my_board, _dirty_cells(opened, height, width))
+    return my_board
+
+def bench_backends(shapes=((10, 10, 10), (16, 30, 99), (64, 64, 614)), games=20, seed=0):
+    print("\n--- array vs bitboard engine (build + full game of reveals and constraint refreshes) ---")
+    print(f"{'board':>8} {'mines':>6} {'array ms':>10} {'bitboard ms':>12} {'speedup':>8}")
+    rng = np.random.default_rng(seed)
+    for height, width, mines in shapes:
+        timings = {ArrayEngine: 0.0, BitboardEngine: 0.0}
+        for _ in range(games):
+            board = np.zeros((height, width), dtype=int)
+            board.flat[rng.choice(height * width, size=mines, replace=False)] = MINE
+            safe = np.flatnonzero(board != MINE)
+            clicks = rng.permutation(safe)
+            results = []
+            for engine_cls in timings:
+                start = time.perf_counter()
+                results.append(_play_engine(engine_cls, board, clicks))
+                timings[engine_cls] += time.perf_counter() - start
+            assert (results[0] == results[1]).all()
+        array_ms = timings[ArrayEngine] / games * 1000
+        bit_ms = timings[BitboardEngine] / games * 1000
+        print(f"{height:>3}x{width:<4} {mines:>6} {array_ms:>10.2f} {bit_ms:>12.2f} {array_ms / bit_ms:>7.2f}x")
+
+def _walk_east(env, columns, checkpoints):
+    # open every safe cell of a 16-row strip heading east. Mines are skipped by looking at
+    # the layout, this exercises storage rather than play. Yields at each checkpoint column
+    env.step(0, 0)
+    for c in range(columns):
+        for r in range(16):
+            if (r, c) not in env.revealed and (r, c) not in env.mines: env.step(r, c)
+        if c + 1 in checkpoints: yield c + 1
+
+def bench_infinite_memory(columns=8000, max_resident_chunks=64, seed=0):
+    print("\n--- infinite env memory, unbounded vs spill store (16-row strip walked east) ---")
+    print(f"{'store':>10} {'columns':>8} {'score':>9} {'resident':>9} {'traced MB':>10} {'cells/s':>9}")
+    checkpoints = {columns // 4, columns // 2, columns}
+    for limit in (None, max_resident_chunks):
+        env = MinesweeperInfiniteEnv(render_mode=None, seed=seed, max_resident_chunks=limit)
+        tracemalloc.start()
+        start = time.perf_counter()
+        for done in _walk_east(env, columns, checkpoints):
+            current, _ = tracemalloc.get_traced_memory()
+            resident = len(env._chunks) if limit is None else len(env._chunks.resident)
+            rate = env.score / (time.perf_counter() - start)
+            label = "unbounded" if limit is None else f"lru {limit}"
+            print(f"{label:>10} {done:>8} {env.score:>9} {resident:>9} {current / 2**20:>10.2f} {rate:>9.0f}")
+        tracemalloc.stop()
+        env.close()
+
+class _RecursiveRingWorld(RingWorld):
+    # the cascade as it was before the chunk-at-a-time version, for comparison
+    def _reveal_cascade(self, r, c, newly_revealed, held=None):
+        chunk, lr, lc = self._ready_cell(r, c)
+        if chunk.visible[lr, lc] >= 0: return {}
+        mine_count = int(chunk.counts[lr, lc])
+        if chunk.visible[lr, lc] == FLAG: self.flag_count -= 1
+        chunk.visible[lr, lc] = mine_count
+        self.revealed_count += 1
+        newly_revealed.append((r, c))
+        if mine_count == 0:
+            for dr, dc in NEIGHBOR_OFFSETS:
+                self._reveal_cascade(r + dr, c + dc, newly_revealed)
+        return {} # no leftover seeds, this version never locks
+
+def bench_flood_fill(radii=(15, 30, 60, 200), recursion_limit=5000):
+    # the old agents ran with sys.setrecursionlimit(5000), so the recursive version gets the same
+    print(f"\n--- infinite env cascade, recursive vs chunk flood (recursion limit {recursion_limit}) ---")
+    print(f"{'cells':>8} {'recursive cells/s':>18} {'chunk flood cells/s':>20}")
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(recursion_limit)
+    try:
+        for radius in radii:
+            rates = []
+            for world in (_RecursiveRingWorld, RingWorld):
+                env = world(radius=radius, render_mode=None, seed=0)
+                start = time.perf_counter()
+                try:
+                    opened = env.step(0, 0)
+                except RecursionError:
+                    rates.append("RecursionError")
+                    continue
+                assert len(opened) == (2 * radius - 1) ** 2
+                rates.append(f"{len(opened) / (time.perf_counter() - start):.0f}")
+            print(f"{(2 * radius - 1) ** 2:>8} {rates[0]:>18} {rates[1]:>20}")
+    finally:
+        sys.setrecursionlimit(old_limit)
+
+def bench_prefetch(columns=1500, think_time=0.001, seed=0):
+    # step latency on the strip walk, with a short sleep between moves standing in for the
+    # agent's solver (that is when the prefetch thread gets the GIL)
+    print(f"\n--- infinite env step latency, prefetch off vs on ({think_time * 1000:.1f} ms think time) ---")
+    print(f"{'prefetch':>9} {'steps':>7} {'mean us':>9} {'p99 us':>9} {'max us':>9}")
+    for prefetch in (False, True):
+        env = MinesweeperInfiniteEnv(render_mode=None, seed=seed, prefetch=prefetch)
+        env.step(0, 0)
+        latencies = []
+        for c in range(columns):
+            for r in range(16):
+                if (r, c) in env.revealed or (r, c) in env.mines: continue
+                time.sleep(think_time)
+                start = time.perf_counter()
+                env.step(r, c)
+                latencies.append(time.perf_counter() - start)
+        env.close()
+        us = np.array(latencies) * 1e6
+        print(f"{str(prefetch):>9} {len(us):>7} {us.mean():>9.1f} {np.percentile(us, 99):>9.1f} {us.max():>9.1f}")
+
+def bench_concurrent_agents(agents=(1, 2, 4, 8), columns=400, think_time=0.0, seed=0):
+    # several walkers sharing one thread_safe world, each opening its own 16-row strip
+    # (strips are two chunk rows apart, so their locks never meet). Total cells/s across them
+    print(f"\n--- shared infinite env, concurrent walkers ({think_time * 1000:.1f} ms think time) ---")
+    print(f"{'agents':>7} {'score':>8} {'cells/s':>9} {'per agent':>10}")
+    for count in agents:
+        env = MinesweeperInfiniteEnv(render_mode=None, seed=seed, thread_safe=True)
+        env.step(0, 0)
+
+        def walk(top):
+            for c in range(columns):
+                for r in range(top, top + 16):
+                    env._generate_chunk(*env._get_chunk_coords(r, c))
+                    if (r, c) in env.revealed or (r, c) in env.mines: continue
+                    if think_time: time.sleep(think_time)
+                    env.step(r, c)
+
+        threads = [threading.Thread(target=walk, args=(i * 32,)) for i in range(count)]
+        start = time.perf_counter()
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        rate = env.score / (time.perf_counter() - start)
+        print(f"{count:>7} {env.score:>8} {rate:>9.0f} {rate / count:>10.0f}")
+        env.close()
+
+def bench_fork(columns=(100, 1000), forks=200, seed=0):
+    # cost of copying an infinite world mid-game: deepcopy vs fork, plus snapshot size and restore
+    print("\n--- infinite env copies, deepcopy vs copy-on-write fork vs snapshot ---")
+    print(f"{'columns':>8} {'chunks':>7} {'deepcopy/s':>11} {'fork/s':>9} {'snapshot KB':>12} {'restore ms':>11}")
+    for count in columns:
+        env = MinesweeperInfiniteEnv(render_mode=None, seed=seed)
+        for _ in _walk_east(env, count, {count}): pass
+        start = time.perf_counter()
+        for _ in range(max(1, forks // 20)): copy.deepcopy(env)
+        deepcopies = max(1, forks // 20) / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(forks): env.fork()
+        fork_rate = forks / (time.perf_counter() - start)
+        data = env.snapshot()
+        start = time.perf_counter()
+        MinesweeperInfiniteEnv(render_mode=None).restore(data)
+        restore_ms = (time.perf_counter() - start) * 1000
+        print(f"{count:>8} {len(env._chunks):>7} {deepcopies:>11.0f} {fork_rate:>9.0f} {len(data) / 1024:>12.1f} {restore_ms:>11.1f}")
+
+def _scanning_backtracking_solve(variables, constraints):
+    # backtracking_solve as it was before the running counters: every node rescans all constraints
+    solutions = []
+    var_counts = defaultdict(int)
+    for v_list, _ in constraints:
+        for v in v_list: var_counts[v] += 1
+    variables.sort(key=lambda v: -var_counts[v])
+    assignment = {}
+
+    def is_valid(assignment):
+        for v_list, limit in constraints:
+            current_sum = 0
+            unassigned = 0
+            for v in v_list:
+                if v in assignment: current_sum += assignment[v]
+                else: unassigned += 1
+            if current_sum > limit: return False
+            if current_sum + unassigned < limit: return False
+        return True
+
+    def backtrack(idx):
+        if len(solutions) > 1000: return
+        if idx == len(variables):
+            solutions.append(assignment.copy())
+            return
+        curr_var = variables[idx]
+        for val in [0, 1]:
+            assignment[curr_var] = val
+            if is_valid(assignment): backtrack(idx + 1)
+        del assignment[curr_var]
+
+    backtrack(0)
+    return solutions
+
+def bench_backtracking(buckets=((20, 29), (30, 40)), board_size=24, num_mines=90, seeds=range(60)):
+    # frontier components left by the first click on random boards, grouped by size
+    print("\n--- backtracking_solve, full constraint rescan vs running counters (20-40 cell components) ---")
+    print(f"{'cells':>7} {'components':>11} {'rescan ms':>10} {'counters ms':>12} {'speedup':>8}")
+    components = []
+    for seed in seeds:
+        env = MinesweeperDiscreetEnv(board_size=board_size, num_mines=num_mines)
+        env.reset(seed=seed)
+        env.step(board_size // 2 * board_size + board_size // 2)
+        components.extend(split_components(generate_constraints(env.my_board, env.my_board.shape[0])))
+    for low, high in buckets:
+        picked = [(v, c) for v, c in components if low <= len(v) <= high]
+        timings = []
+        for solve in (_scanning_backtracking_solve, backtracking_solve):
+            start = time.perf_counter()
+            results = [solve(list(v), c) for v, c in picked]
+            timings.append((time.perf_counter() - start) * 1000 / max(1, len(picked)))
+            if solve is _scanning_backtracking_solve: expected = results
+        assert results == expected, "Solvers disagree"
+        print(f"{f'{low}-{high}':>7} {len(picked):>11} {timings[0]:>10.2f} {timings[1]:>12.2f} {timings[0] / timings[1]:>7.1f}x")
+
+def _tally_enumerated(variables, constraints):
+    # what solve_csp did before count_solutions: keep every solution, then count per variable
+    solutions = backtracking_solve(variables, constraints)
+    return len(solutions), {v: sum(sol[v] for sol in solutions) for v in variables}
+
+def bench_count_only(low=20, high=40, board_size=24, num_mines=90, seeds=range(60)):
+    print(f"\n--- per-cell mine tallies, stored solutions vs count-only ({low}-{high} cell components) ---")
+    print(f"{'mode':>11} {'components':>11} {'ms each':>8} {'peak KB':>8}")
+    picked = []
+    for seed in seeds:
+        env = MinesweeperDiscreetEnv(board_size=board_size, num_mines=num_mines)
+        env.reset(seed=seed)
+        env.step(board_size // 2 * board_size + board_size // 2)
+        picked.extend((v, c) for v, c in split_components(generate_constraints(env.my_board, env.my_board.shape[0])) if low <= len(v) <= high)
+    for label, solve in (("enumerate", _tally_enumerated), ("count-only", count_solutions)):
+        peak = elapsed = 0
+        for v, c in picked:
+            tracemalloc.start()
+            start = time.perf_counter()
+            solve(list(v), c)
+            elapsed += time.perf_counter() - start
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        print(f"{label:>11} {len(picked):>11} {elapsed * 1000 / max(1, len(picked)):>8.2f} {peak / 1024:>8.1f}")
+
+if __name__ == "__main__":
+    bench_backends()
+    bench_infinite_memory()
+    bench_flood_fill()
+    bench_prefetch()
+    bench_concurrent_agents()
+    bench_concurrent_agents(think_time=0.0005)
+    bench_fork()
+    bench_backtracking()
+    bench_count_only()
@@ -0,0 +1,365 @@
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Mapping, MutableMapping, Set
+import numpy as np
+from constants import CLOSED, FLAG
+from constraints import NEIGHBOR_OFFSETS
+
+# Chunk storage for the infinite env. Every CHUNK_SIZE x CHUNK_SIZE block of the world
+# is one Chunk holding small arrays instead of one python tuple per cell:
+#   mines   - bool, where the mines are
+#   visible - int8, what the player sees: CLOSED, FLAG, MINE (exploded) or 0-8
+#   counts  - int8 neighbour mine counts, filled in once the 8 surrounding chunks exist
+
+def _zigzag(n):
+    # seed sequences only take non-negative words: 0, -1, 1, -2, ... -> 0, 1, 2, 3, ...
+    return 2 * n if n >= 0 else -2 * n - 1
+
+def chunk_mines(world_seed, cr, cc, size, density, safe_cell=None):
+    # the mine layout of chunk (cr, cc) is a pure function of its inputs, so any chunk can
+    # be built in any order, in any process, or dropped and rebuilt bit-for-bit later.
+    # safe_cell is the first click: the 3x3 around it is laid over the layout mine-free
+    rng = np.random.default_rng([world_seed, _zigzag(cr), _zigzag(cc)])
+    mines = rng.random((size, size)) < density
+    if safe_cell is not None:
+        lr, lc = safe_cell[0] - cr * size, safe_cell[1] - cc * size
+        if -1 <= lr <= size and -1 <= lc <= size:
+            mines[max(lr - 1, 0):lr + 2, max(lc - 1, 0):lc + 2] = False
+    return mines
+
+# (source slice in the neighbouring chunk, destination slice in the padded window) per offset
+def halo_slices(size):
+    return {-1: (slice(size - 1, size), slice(0, 1)),
+            0: (slice(0, size), slice(1, size + 1)),
+            1: (slice(0, 1), slice(size + 1, size + 2))}
+
+def neighbor_counts(ring):
+    # ring maps (dcr, dcc) in {-1, 0, 1}^2 to the mine arrays of a chunk and its 8 neighbours;
+    # returns the centre chunk's neighbour counts from one padded window and 8 shifted sums
+    size = ring[(0, 0)].shape[0]
+    halo = halo_slices(size)
+    padded = np.zeros((size + 2, size + 2), dtype=np.int8)
+    for (dcr, dcc), mines in ring.items():
+        (src_r, dst_r), (src_c, dst_c) = halo[dcr], halo[dcc]
+        padded[dst_r, dst_c] = mines[src_r, src_c]
+    counts = np.zeros((size, size), dtype=np.int8)
+    for dr, dc in NEIGHBOR_OFFSETS:
+        counts += padded[1 + dr:1 + dr + size, 1 + dc:1 + dc + size]
+    return counts
+
+def _pack(mask):
+    # (S, S) bool -> one python int over the zero-padded (S + 2, S + 2) window, row-major
+    stride = mask.shape[0] + 2
+    padded = np.zeros((stride, stride), dtype=bool)
+    padded[1:-1, 1:-1] = mask
+    return int.from_bytes(np.packbits(padded, bitorder='little').tobytes(), 'little')
+
+def _unpack(bits, stride):
+    # inverse of _pack, keeping the padding: -> (stride, stride) bool
+    raw = np.frombuffer(bits.to_bytes((stride * stride + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder='little')[:stride * stride].reshape(stride, stride).astype(bool)
+
+def flood_chunk(seeds, openable, zero):
+    # grow the seeds through zeros inside one chunk by repeated 8-neighbour dilation, like
+    # the vector env's cascade but on one int per chunk: with a row stride of S + 2 the
+    # padding columns soak up the shifts, so nothing wraps into the next row.
+    # Returns the opened cells and the padded dilation of the opened zeros; its 1-cell
+    # border is where the flood spills into the neighbouring chunks
+    stride = seeds.shape[0] + 2
+    openable, zero = _pack(openable), _pack(zero)
+    opened = _pack(seeds) & openable
+    frontier = opened & zero
+    reach = 0
+    while frontier:
+        grown = frontier | (frontier << 1) | (frontier >> 1)
+        grown |= (grown << stride) | (grown >> stride)
+        reach |= grown
+        new = grown & openable & ~opened
+        opened |= new
+        frontier = new & zero
+    return _unpack(opened, stride)[1:-1, 1:-1], _unpack(reach, stride)
+
+class Chunk:
+    __slots__ = ("mines", "visible", "counts", "shared")
+
+    def __init__(self, mines):
+        self.mines = mines
+        self.visible = np.full(mines.shape, CLOSED, dtype=np.int8)
+        self.counts = None
+        self.shared = False               # also held by a forked env: copy before writing
+
+    def copy(self):
+        # a private copy to write to; mines and counts are never written in place, so they are shared
+        chunk = Chunk.__new__(Chunk)
+        chunk.mines, chunk.visible, chunk.counts, chunk.shared = self.mines, self.visible.copy(), self.counts, False
+        return chunk
+
+    def nbytes(self):
+        counts = 0 if self.counts is None else self.counts.nbytes
+        return self.mines.nbytes + self.visible.nbytes + counts
+
+# Optional bounded store: an LRU of resident chunks in front of a memory-mapped spill
+# file. Only the visible array is written out, the mines are rebuilt from the seed when
+# a chunk is paged back in. Chunks nobody has touched yet are simply dropped on eviction,
+# regenerating them gives the same chunk.
+
+class SpillFile:
+    def __init__(self, size, path=None):
+        self.size = size
+        self._owned = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix=".chunks")
+            os.close(fd)
+        else:
+            open(path, "wb").close()
+        self.path = path
+        self.slots = {}                   # (cr, cc) -> slot in the file
+        self._free = []
+        self._capacity = 0
+        self._data = None
+
+    def _grow(self):
+        # double the file and map it again
+        capacity = max(64, 2 * self._capacity)
+        if self._data is not None: self._data.flush()
+        with open(self.path, "r+b") as f:
+            f.truncate(capacity * self.size * self.size)
+        self._data = np.memmap(self.path, dtype=np.int8, mode="r+", shape=(capacity, self.size, self.size))
+        self._free.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+
+    def write(self, key, visible):
+        if not self._free: self._grow()
+        slot = self._free.pop()
+        self._data[slot] = visible
+        self.slots[key] = slot
+
+    def read(self, key):
+        return np.array(self._data[self.slots[key]])
+
+    def take(self, key):
+        # read a chunk back and give its slot up, it is resident again
+        visible = self.read(key)
+        self._free.append(self.slots.pop(key))
+        return visible
+
+    def clear(self):
+        self._free.extend(self.slots.values())
+        self.slots.clear()
+
+    def close(self):
+        self._data = None
+        if self._owned and os.path.exists(self.path): os.remove(self.path)
+
+class ChunkStore(MutableMapping):
+    # drop-in for the env's {(cr, cc): Chunk} dict. Eviction only happens in trim(), which the
+    # env calls between moves, so a chunk held by a running cascade is never written out under it
+    def __init__(self, max_resident, make_mines, size, spill_path=None):
+        self.max_resident = max_resident
+        self._make_mines = make_mines
+        self.resident = OrderedDict()
+        self._spill = SpillFile(size, spill_path)
+
+    def _load(self, key, visible):
+        chunk = Chunk(self._make_mines(*key))
+        chunk.visible[:] = visible
+        return chunk
+
+    def get(self, key, default=None):
+        chunk = self.resident.get(key)
+        if chunk is not None:
+            self.resident.move_to_end(key)
+            return chunk
+        if key in self._spill.slots:
+            chunk = self._load(key, self._spill.take(key))
+            self.resident[key] = chunk
+            return chunk
+        return default
+
+    def __getitem__(self, key):
+        chunk = self.get(key)
+        if chunk is None: raise KeyError(key)
+        return chunk
+
+    def __setitem__(self, key, chunk):
+        self.resident[key] = chunk
+        self.resident.move_to_end(key)
+
+    def __delitem__(self, key):
+        if key in self._spill.slots: self._spill.take(key)
+        else: del self.resident[key]
+
+    def __contains__(self, key):
+        return key in self.resident or key in self._spill.slots
+
+    def __iter__(self):
+        yield from list(self.resident)
+        yield from list(self._spill.slots)
+
+    def __len__(self):
+        return len(self.resident) + len(self._spill.slots)
+
+    def items(self):
+        # spilled chunks are read without paging them in
+        for key, chunk in list(self.resident.items()):
+            yield key, chunk
+        for key in list(self._spill.slots):
+            yield key, self._load(key, self._spill.read(key))
+
+    def trim(self):
+        while len(self.resident) > self.max_resident:
+            key, chunk = self.resident.popitem(last=False)
+            if (chunk.visible != CLOSED).any(): self._spill.write(key, chunk.visible)
+
+    def clear(self):
+        self.resident.clear()
+        self._spill.clear()
+
+    def close(self):
+        self.clear()
+        self._spill.close()
+
+# Optional background prefetching. Worker threads build chunks ahead of the frontier from the
+# pure layout function, and publish each finished chunk into `ready` with a single dict
+# assignment, its neighbour counts into `counts`. The env only ever adopts from there, so it
+# never sees a half-built chunk, and a reset bumps the token so work for an old world is dropped.
+# Chunks the env never adopts (the outer ring of a prefetched area, mostly) go stale: whatever
+# was published more than max_age requests ago is dropped, and the oldest go first when full.
+
+class ChunkPrefetcher:
+    def __init__(self, workers=1, max_ready=4096, max_age=64):
+        self.max_ready = max_ready
+        self.max_age = max_age
+        self.ready = {}                   # (cr, cc) -> Chunk, mines only
+        self.counts = {}                  # (cr, cc) -> its neighbour counts
+        self._published = {}              # (cr, cc) -> request number it was built for, oldest first
+        self._requests = 0
+        self._pending = set()
+        self._token = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunk-prefetch")
+
+    def request(self, keys, layout):
+        # layout(cr, cc) -> mines for the current world
+        with self._lock:
+            self._requests += 1
+            self._evict(self.max_ready - len(keys))
+            keys = [key for key in keys if key not in self._pending and key not in self.ready]
+            if not keys: return
+            self._pending.update(keys)
+            token = self._token
+        self._executor.submit(self._build, keys, layout, token, self._requests)
+
+    def _evict(self, room):
+        # drop what is stale, then the oldest until at most `room` entries are left
+        for key, requested in list(self._published.items()):
+            if self._requests - requested <= self.max_age and len(self._published) <= max(room, 0): break
+            self._drop(key)
+
+    def _drop(self, key):
+        self.ready.pop(key, None)
+        self.counts.pop(key, None)
+        self._published.pop(key, None)
+
+    def _build(self, keys, layout, token, requested):
+        cache = {}
+        def mines(key):
+            if key not in cache: cache[key] = layout(*key)
+            return cache[key]
+        for cr, cc in keys:
+            if token != self._token: return
+            chunk = Chunk(mines((cr, cc)))
+            counts = neighbor_counts({(dcr, dcc): mines((cr + dcr, cc + dcc))
+                                      for dcr in (-1, 0, 1) for dcc in (-1, 0, 1)})
+            with self._lock:
+                if token != self._token: return
+                self.ready[(cr, cc)] = chunk
+                self.counts[(cr, cc)] = counts
+                self._published[(cr, cc)] = requested
+                self._pending.discard((cr, cc))
+            # hand the GIL back between chunks so a step never waits out a whole switch interval
+            time.sleep(0)
+
+    def take(self, key):
+        # the counts stay until the chunk is prepared (take_counts) or they go stale
+        with self._lock:
+            return self.ready.pop(key, None)
+
+    def take_counts(self, key):
+        with self._lock:
+            counts = self.counts.pop(key, None)
+            self._drop(key)
+            return counts
+
+    def reset(self):
+        with self._lock:
+            self._token += 1
+            self.ready.clear()
+            self.counts.clear()
+            self._published.clear()
+            self._pending.clear()
+
+    def close(self):
+        self.reset()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+# Read-only views so code written against the old sets/dicts (agents doing
+# `(r, c) in env.revealed`, `env.revealed[(r, c)]`, `(r, c) in env.flags`) keeps working
+
+class _ChunkView:
+    def __init__(self, env):
+        self._env = env
+
+    def _visible(self, cell):
+        chunk, lr, lc = self._env._cell(*cell)
+        if chunk is None: return CLOSED
+        return int(chunk.visible[lr, lc])
+
+    def _cells(self, select):
+        size = self._env.CHUNK_SIZE
+        for (cr, cc), chunk in list(self._env._chunks.items()):
+            for lr, lc in zip(*np.nonzero(select(chunk))):
+                yield (cr * size + int(lr), cc * size + int(lc))
+
+class RevealedView(_ChunkView, Mapping):
+    # (r, c) -> number, or MINE for the cell that ended the game
+    def __contains__(self, cell):
+        value = self._visible(cell)
+        return value != CLOSED and value != FLAG
+
+    def __getitem__(self, cell):
+        value = self._visible(cell)
+        if value == CLOSED or value == FLAG: raise KeyError(cell)
+        return value
+
+    def __iter__(self):
+        return self._cells(lambda chunk: chunk.visible > CLOSED)
+
+    def __len__(self):
+        return self._env.revealed_count
+
+class FlagView(_ChunkView, Set):
+    def __contains__(self, cell):
+        return self._visible(cell) == FLAG
+
+    def __iter__(self):
+        return self._cells(lambda chunk: chunk.visible == FLAG)
+
+    def __len__(self):
+        return self._env.flag_count
+
+class MineView(_ChunkView, Set):
+    # only covers generated chunks, like the old mines set did
+    def __contains__(self, cell):
+        chunk, lr, lc = self._env._cell(*cell)
+        return chunk is not None and bool(chunk.mines[lr, lc])
+
+    def __iter__(self):
+        return self._cells(lambda chunk: chunk.mines)
+
+    def __len__(self):
+        return sum(int(chunk.mines.sum()) for chunk in self._env._chunks.values())
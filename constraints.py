@@ -1,44 +1,322 @@
+import math
+from collections import defaultdict, deque
 import numpy as np
 from constants import CLOSED, FLAG
 
+# neighbour offsets in row-major order, so hidden cells come out sorted by flat index
+NEIGHBOR_OFFSETS = np.array([(-1, -1), (-1, 0), (-1, 1),
+                             (0, -1),           (0, 1),
+                             (1, -1),  (1, 0),  (1, 1)])
+
+def _neighbor_layers(padded, height, width):
+    # stack of 8 shifted views: layer k holds each cell's k-th neighbour
+    return np.stack([padded[1 + dr:1 + dr + height, 1 + dc:1 + dc + width]
+                     for dr, dc in NEIGHBOR_OFFSETS])
+
+def generate_constraint_arrays(my_board, cells=None):
+    # vectorized constraint extraction in CSR layout (sources, indices, indptr, rhs), flat indices;
+    # `cells` limits the sources to those cells
+    height, width = my_board.shape
+    padded = np.zeros((height + 2, width + 2), dtype=my_board.dtype)
+    padded[1:-1, 1:-1] = my_board
+
+    if cells is None:
+        # whole board: count closed/flagged neighbours with array shifts
+        layers = _neighbor_layers(padded, height, width)
+        closed_counts = np.count_nonzero(layers == CLOSED, axis=0)
+        sources = np.flatnonzero((my_board >= 0) & (closed_counts > 0))
+        rows, cols = np.divmod(sources, width)
+        values = my_board.ravel()[sources]
+    else:
+        cells = np.unique(np.asarray(cells, dtype=np.intp))
+        rows, cols = np.divmod(cells, width)
+        values = my_board[rows, cols]
+        keep = values >= 0
+        sources, rows, cols, values = cells[keep], rows[keep], cols[keep], values[keep]
+
+    # gather the 8 neighbours of every source cell, shape (n, 8)
+    nr = rows[:, None] + NEIGHBOR_OFFSETS[:, 0]
+    nc = cols[:, None] + NEIGHBOR_OFFSETS[:, 1]
+    neighbor_vals = padded[nr + 1, nc + 1]
+    hidden = neighbor_vals == CLOSED
+    flagged = np.count_nonzero(neighbor_vals == FLAG, axis=1)
+
+    # sources given explicitly may have no hidden neighbours left
+    has_hidden = hidden.any(axis=1)
+    if not has_hidden.all():
+        sources, nr, nc, values = sources[has_hidden], nr[has_hidden], nc[has_hidden], values[has_hidden]
+        hidden, flagged = hidden[has_hidden], flagged[has_hidden]
+
+    indices = (nr * width + nc)[hidden]
+    indptr = np.zeros(len(sources) + 1, dtype=np.intp)
+    np.cumsum(np.count_nonzero(hidden, axis=1), out=indptr[1:])
+    # if rhs < 0, player made a mistake (flagged too many), pass it anyway
+    rhs = values - flagged
+    return sources, indices, indptr, rhs
+
+def csr_to_constraints(indices, indptr, rhs, width):
+    # adapter back to the list-of-tuples format: [([(r, c), ...], mines), ...]
+    rows, cols = np.divmod(indices, width)
+    cells = list(zip(rows.tolist(), cols.tolist()))
+    bounds = indptr.tolist()
+    return [(cells[bounds[i]:bounds[i + 1]], int(rhs[i])) for i in range(len(rhs))]
+
 def generate_constraints(my_board, board_size):
-    constraints = []
-    
-    def is_valid_local(x, y):
-        return (x >= 0) and (x < board_size) and (y >= 0) and (y < board_size)
-    
-    for r in range(board_size):                         # r is row num
-        for c in range(board_size):                     # c is col num
-            cell_value = my_board[r, c]                 # val of cell visible to the player
-            
-            # only revealed number cells (>=0) provide constraints
-            if cell_value >= 0:
-                hidden_neighbors = []
-                flagged_count = 0
-                
-                for dx in [-1, 0, 1]:
-                    for dy in [-1, 0, 1]:
-                        if dx == 0 and dy == 0:
-                            continue
-                        
-                        nr = r + dx
-                        nc = c + dy
-                        
-                        if is_valid_local(nr, nc):
-                            neighbor_value = my_board[nr, nc]
-                            
-                            if neighbor_value == CLOSED:
-                                hidden_neighbors.append((nr, nc))
-                            elif neighbor_value == FLAG:
-                                flagged_count += 1
-                
-                bombs_remaining = cell_value - flagged_count
-                
-                # only create constraint if hidden neighbors involved
-                if len(hidden_neighbors) > 0:
-                    # if bombs_remaining < 0, player made a mistake (flagged too many), 
-                    # (pass it anyway or clamp)
-                    constraint = (hidden_neighbors, bombs_remaining) 
-                    constraints.append(constraint)
-    
-    return constraints
\ No newline at end of file
+    board = np.asarray(my_board)[:board_size, :board_size]
+    _, indices, indptr, rhs = generate_constraint_arrays(board)
+    return csr_to_constraints(indices, indptr, rhs, board.shape[1])
+
+def split_components(all_constraints):
+    # group the hidden cells into independent components (cells are connected if they
+    # share a constraint); returns (variables, constraints) for each component
+    var_to_constraints = defaultdict(list)
+    all_vars = set()
+    for i, (vars_in_constraint, _) in enumerate(all_constraints):
+        for v in vars_in_constraint:
+            var_to_constraints[v].append(i)
+            all_vars.add(v)
+
+    components = []
+    visited = set()
+    for v in all_vars:
+        if v in visited: continue
+        component_vars = set([v])
+        q = [v]
+        visited.add(v)
+        while q:
+            curr = q.pop(0)
+            for c_idx in var_to_constraints[curr]:
+                for neighbor in all_constraints[c_idx][0]:
+                    if neighbor not in visited:
+                        visited.add(neighbor)
+                        component_vars.add(neighbor)
+                        q.append(neighbor)
+
+        comp_vars = list(component_vars)
+        comp_constraints = []
+        seen_constraint_indices = set()
+        for u in comp_vars:
+            for c_idx in var_to_constraints[u]:
+                if c_idx not in seen_constraint_indices:
+                    seen_constraint_indices.add(c_idx)
+                    comp_constraints.append(all_constraints[c_idx])
+        components.append((comp_vars, comp_constraints))
+    return components
+
+def reduce_constraints(all_constraints):
+    # cheap deductions before any search: all-safe/all-mine constraints, and A inside B turns
+    # B into B - A, until nothing changes. Returns (safe, mines, constraints left over unknown cells)
+    constraints = {}                    # id -> (frozenset of cells, mines)
+    by_cell = defaultdict(set)          # cell -> ids of the constraints holding it
+    by_cells = {}                       # frozenset of cells -> id, drops duplicates
+    pending = deque()
+    safe, mines = set(), set()
+    next_id = 0
+
+    def add(cells, rhs):
+        nonlocal next_id
+        cells = frozenset(cells)
+        if not cells or cells in by_cells: return
+        constraints[next_id] = (cells, rhs)
+        by_cells[cells] = next_id
+        for cell in cells: by_cell[cell].add(next_id)
+        pending.append(next_id)
+        next_id += 1
+
+    def remove(cid):
+        cells, _ = constraints.pop(cid)
+        del by_cells[cells]
+        for cell in cells: by_cell[cell].discard(cid)
+
+    def settle(cell, is_mine):
+        (mines if is_mine else safe).add(cell)
+        for cid in list(by_cell.pop(cell, ())):
+            cells, rhs = constraints[cid]
+            remove(cid)
+            add(cells - {cell}, rhs - is_mine)
+
+    for cells, rhs in all_constraints: add(cells, rhs)
+    while pending:
+        cid = pending.popleft()
+        if cid not in constraints: continue
+        cells, rhs = constraints[cid]
+        if rhs < 0 or rhs > len(cells): continue            # contradiction, left for the search
+        if rhs == 0 or rhs == len(cells):
+            for cell in cells:
+                if cell not in safe and cell not in mines: settle(cell, rhs > 0)
+            continue
+
+        for other in set().union(*(by_cell[cell] for cell in cells)) - {cid}:
+            other_cells, other_rhs = constraints[other]
+            if other_cells < cells:
+                remove(cid)
+                add(cells - other_cells, rhs - other_rhs)
+                break
+            if cells < other_cells:
+                remove(other)
+                add(other_cells - cells, other_rhs - rhs)
+
+    left = [(sorted(cells), rhs) for cells, rhs in constraints.values()]
+    return safe, mines, left
+
+def _reduced_echelon(matrix):
+    # exact integer rref of [A | b]: rows scaled by positive numbers and divided by their gcd,
+    # switching to Python ints (dtype=object) before int64 could overflow
+    m = matrix.copy()
+    row = 0
+    for col in range(m.shape[1] - 1):
+        if row == len(m): break
+        nonzero = np.flatnonzero(m[row:, col])
+        if not len(nonzero): continue
+        m[[row, row + nonzero[0]]] = m[[row + nonzero[0], row]]
+        others = np.flatnonzero(m[:, col])
+        others = others[others != row]
+        if len(others):
+            if m.dtype != object and np.abs(m).max() > 2 ** 31: m = m.astype(object)
+            pivot = m[row, col]
+            m[others] = abs(pivot) * m[others] - (1 if pivot > 0 else -1) * m[others, col][:, None] * m[row]
+            g = np.gcd.reduce(m[others], axis=1)
+            g[g == 0] = 1
+            m[others] //= g[:, None]
+        row += 1
+    return m[:row]
+
+def linear_deductions(all_constraints):
+    # gaussian elimination over the 0/1 constraint matrix: a row whose right side is its lowest or
+    # highest possible value forces all its cells. Polynomial, returns like reduce_constraints
+    known = {}                          # cell -> 0 (safe) or 1 (mine)
+    # components one at a time: several small eliminations are much cheaper than one big one
+    for cells, component in split_components(all_constraints):
+        column = {cell: j for j, cell in enumerate(cells)}
+        matrix = np.zeros((len(component), len(cells) + 1), dtype=np.int64)
+        for i, (constraint_cells, rhs) in enumerate(component):
+            matrix[i, [column[cell] for cell in constraint_cells]] = 1
+            matrix[i, -1] = rhs
+
+        while True:
+            found = {}
+            # the original rows too: elimination can mix a row that was forced on its own
+            rows = np.concatenate([matrix, _reduced_echelon(matrix)])
+            coefficients, rhs = rows[:, :-1], rows[:, -1]
+            low = np.where(coefficients < 0, coefficients, 0).sum(axis=1)
+            high = np.where(coefficients > 0, coefficients, 0).sum(axis=1)
+            forced = ((rhs == low) | (rhs == high)) & (low != high)        # low == high: no cells left
+            # at the high end the positive-coefficient cells are mines, at the low end the negative ones
+            values = (coefficients[forced] > 0) == (rhs == high)[forced][:, None]
+            for i, j in zip(*np.nonzero(coefficients[forced])):
+                found.setdefault(int(j), int(values[i, j]))
+            if not found: break
+            for j, value in found.items(): known[cells[j]] = value
+            # substitute: move the known cells to the right-hand side
+            columns = np.array(list(found))
+            matrix[:, -1] -= matrix[:, columns] @ np.array(list(found.values()))
+            matrix[:, columns] = 0
+
+    safe = {cell for cell, value in known.items() if value == 0}
+    mines = {cell for cell, value in known.items() if value == 1}
+    left = []
+    for constraint_cells, rhs in all_constraints:
+        unknown = [cell for cell in constraint_cells if cell not in known]
+        if unknown: left.append((unknown, rhs - sum(known.get(cell, 0) for cell in constraint_cells)))
+    return safe, mines, left
+
+def _convolve(a, b):
+    # distributions of mine totals as {k: ways}; ways of the sum of two independent parts
+    out = defaultdict(int)
+    for ka, wa in a.items():
+        for kb, wb in b.items(): out[ka + kb] += wa * wb
+    return dict(out)
+
+def _logsumexp(values):
+    if not values: return -math.inf
+    top = max(values)
+    if top == -math.inf: return top
+    return top + math.log(sum(math.exp(v - top) for v in values))
+
+def mine_probabilities(board_state, num_mines, tallies):
+    # exact mine probability of every closed cell (NaN elsewhere) from the per-component tallies,
+    # weighting each frontier total by the interior placements; done in log space so it can't overflow
+    closed = np.asarray(board_state) == CLOSED
+    mines_left = num_mines - int(np.count_nonzero(np.asarray(board_state) == FLAG))
+    dists = [{k: n for k, (n, _) in tally.items()} for tally in tallies]
+    frontier = {cell for tally in tallies for _, counts in tally.values() for cell in counts}
+    interior = int(closed.sum()) - len(frontier)
+
+    # the frontier's mine-total distribution, and for each component that of all the others
+    prefix = [{0: 1}]
+    for dist in dists: prefix.append(_convolve(prefix[-1], dist))
+    suffix = [{0: 1}]
+    for dist in reversed(dists): suffix.append(_convolve(suffix[-1], dist))
+    suffix.reverse()
+    total = prefix[-1]
+
+    def log_binomial(n, k):
+        return math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+
+    feasible = any(0 <= mines_left - k <= interior for k in total)
+
+    def log_weight(k):
+        # log of the interior placements left for a frontier total of k
+        if not feasible: return 0.0
+        if not 0 <= mines_left - k <= interior: return -math.inf
+        return log_binomial(interior, mines_left - k)
+
+    log_terms = {k: math.log(ways) + log_weight(k) for k, ways in total.items()}
+    log_z = _logsumexp(list(log_terms.values()))
+
+    probabilities = np.full(closed.shape, np.nan)
+    if interior > 0:
+        expected = sum(math.exp(term - log_z) * min(max(mines_left - k, 0), interior) for k, term in log_terms.items())
+        probabilities[closed] = expected / interior
+
+    for cell in frontier: probabilities[cell] = 0.0
+    for i, tally in enumerate(tallies):
+        others = _convolve(prefix[i], suffix[i + 1])
+        for k, (_, counts) in tally.items():
+            # weight of each solution with k mines here, over all the ways to fill the rest
+            log_share = _logsumexp([math.log(ways) + log_weight(k + rest) for rest, ways in others.items()]) - log_z
+            if log_share == -math.inf: continue
+            share = math.exp(log_share)
+            for cell, mines in counts.items(): probabilities[cell] += mines * share
+    return probabilities
+
+def estimate_probabilities(board_state, num_mines, all_constraints):
+    # cheap stand-in for mine_probabilities when tallies are incomplete: a frontier cell takes its
+    # densest constraint's density, the interior shares the leftover mines
+    closed = np.asarray(board_state) == CLOSED
+    mines_left = num_mines - int(np.count_nonzero(np.asarray(board_state) == FLAG))
+    density = defaultdict(float)
+    for cells, rhs in all_constraints:
+        for cell in cells: density[cell] = max(density[cell], min(max(rhs / len(cells), 0.0), 1.0))
+
+    probabilities = np.full(closed.shape, np.nan)
+    interior = int(closed.sum()) - len(density)
+    if interior > 0:
+        probabilities[closed] = min(max((mines_left - sum(density.values())) / interior, 0.0), 1.0)
+    for cell, p in density.items(): probabilities[cell] = p
+    return probabilities
+
+def guess_probabilities(board_state, num_mines, count_solutions):
+    # deduction tiers first, then count_solutions on what is left; exact unless a component
+    # reports the solution cap, in which case estimate_probabilities is used instead
+    board = np.array(board_state)
+    safe, mines, residual = reduce_constraints(generate_constraints(board, board.shape[0]))
+    linear_safe, linear_mines, residual = linear_deductions(residual)
+    safe |= linear_safe
+    mines |= linear_mines
+    # known cells leave the closed pool: mines count like flags, safe cells like numbers
+    for cell in mines: board[cell] = FLAG
+    for cell in safe: board[cell] = 0
+
+    tallies = []
+    for comp_vars, comp_constraints in split_components(residual):
+        total, _, histogram, capped = count_solutions(comp_vars, comp_constraints)
+        if capped:
+            probabilities = estimate_probabilities(board, num_mines, residual)
+            break
+        if total: tallies.append(histogram)
+    else:
+        probabilities = mine_probabilities(board, num_mines, tallies)
+    for cell in safe: probabilities[cell] = 0.0
+    for cell in mines: probabilities[cell] = 1.0
+    return probabilities
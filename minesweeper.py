@@ -1,12 +1,28 @@
 import sys
-from random import randint, seed, random
+import threading
+from contextlib import contextmanager
+from collections import deque
 import numpy as np
 import gymnasium as gym
 from gymnasium import spaces
+from gymnasium.utils import seeding
+from gymnasium.vector import VectorEnv
+from gymnasium.vector.utils import batch_space
+
+try:
+    from gymnasium.vector import AutoresetMode
+    NEXT_STEP_AUTORESET = AutoresetMode.NEXT_STEP
+except ImportError:
+    # gymnasium < 1.1 has no AutoresetMode enum, but next-step is its only behaviour
+    NEXT_STEP_AUTORESET = "NextStep"
 
 # --- IMPORTS ---
 from constants import DEFAULT_BOARD_SIZE, CLOSED, MINE, FLAG
-from constraints import generate_constraints
+from constraints import NEIGHBOR_OFFSETS, generate_constraint_arrays, csr_to_constraints
+from bitboard import BitboardEngine
+from snapshot import pack_state, unpack_state, rng_state, make_rng
+from replay import ReplayWriter, FIXED_ENV, INFINITE_ENV
+from chunks import Chunk, ChunkStore, ChunkPrefetcher, chunk_mines, neighbor_counts, flood_chunk, halo_slices, RevealedView, FlagView, MineView
 
 try:
     import pygame
@@ -38,29 +54,117 @@ def is_win(my_board, num_mines):
 def is_mine(board, x, y):
     return board[x, y] == MINE
 
-def place_mines_safely(board_size, num_mines, first_x, first_y):
-    forbidden = set()
-    for x in range(first_x - 1, first_x + 2):
-        for y in range(first_y - 1, first_y + 2):
-            if 0 <= x < board_size and 0 <= y < board_size:
-                forbidden.add((x, y))  
+def place_mines_safely(board_size, num_mines, first_x, first_y, rng=None):
+    # one draw without replacement from the cells outside the first click's 3x3
+    if rng is None: rng = np.random.default_rng()
+    rows, cols = np.divmod(np.arange(board_size * board_size), board_size)
+    forbidden = (np.abs(rows - first_x) <= 1) & (np.abs(cols - first_y) <= 1)
+    allowed = np.flatnonzero(~forbidden)
+    if num_mines > len(allowed):
+        raise ValueError(f"Cannot place {num_mines} mines on a {board_size}x{board_size} board outside the first click")
 
     board = np.zeros((board_size, board_size), dtype=int)
-    mines_placed = 0
+    board.flat[rng.choice(allowed, size=num_mines, replace=False)] = MINE
+    return board
 
-    while mines_placed < num_mines:
-        rnd = randint(0, board_size * board_size - 1)
-        x = rnd // board_size
-        y = rnd % board_size
+def count_adjacent_mines(board):
+    # adjacency board: neighbour mine count for safe cells, MINE for mines
+    mines = (board == MINE)
+    padded = np.pad(mines, 1).astype(int)
+    h, w = board.shape
+    counts = sum(padded[1 + dr:1 + dr + h, 1 + dc:1 + dc + w] for dr, dc in NEIGHBOR_OFFSETS)
+    return np.where(mines, MINE, counts)
 
-        if (x, y) in forbidden:
-            continue
+def label_zero_regions(adjacency, blocked=None):
+    # 8-connected zero regions: (labels 1..K, region_ptr, region_cells) with each region's cells
+    # plus border as flat indices; `blocked` cells (flags) stop the cascade
+    h, w = adjacency.shape
+    zeros = adjacency == 0
+    if blocked is not None: zeros &= ~blocked
+    big = h * w
+    flat_ids = np.arange(big).reshape(h, w)
 
-        if is_valid(x, y, board_size) and not is_mine(board, x, y):
-            board[x, y] = MINE
-            mines_placed += 1
+    # min-label propagation with pointer jumping, one whole-board pass per round
+    labels = np.where(zeros, flat_ids, big)
+    while True:
+        padded = np.pad(labels, 1, constant_values=big)
+        best = labels.copy()
+        for dr, dc in NEIGHBOR_OFFSETS:
+            np.minimum(best, padded[1 + dr:1 + dr + h, 1 + dc:1 + dc + w], out=best)
+        best = np.where(zeros, best, big)
+        jumped = np.append(best.ravel(), big)
+        best = np.minimum(best, jumped[best])
+        if np.array_equal(best, labels): break
+        labels = best
 
-    return board
+    roots, compact = np.unique(labels[zeros], return_inverse=True)
+    out = np.zeros((h, w), dtype=int)
+    out[zeros] = compact + 1
+
+    # every cell in the 3x3 block of a zero cell is opened along with its region
+    zr, zc = np.nonzero(zeros)
+    zl = out[zr, zc]
+    block = np.vstack([NEIGHBOR_OFFSETS, [(0, 0)]])
+    nr = zr[:, None] + block[:, 0]
+    nc = zc[:, None] + block[:, 1]
+    inside = (nr >= 0) & (nr < h) & (nc >= 0) & (nc < w)
+    if blocked is not None: inside[inside] = ~blocked[nr[inside], nc[inside]]
+    region_of = np.broadcast_to(zl[:, None], nr.shape)[inside]
+    cells = (nr * w + nc)[inside]
+    pairs = np.unique(region_of * big + cells)
+    region_of, cells = np.divmod(pairs, big)
+    region_ptr = np.searchsorted(region_of, np.arange(len(roots) + 1) + 1)
+    return out, region_ptr, cells
+
+# --- Board Engines ---
+# an engine owns the hidden board of a fixed-size game: it reveals cells into the
+# player's board and extracts constraints. BitboardEngine (bitboard.py) is the alternative.
+
+class ArrayEngine:
+    def __init__(self, board):
+        self.adjacency = count_adjacent_mines(board)
+        self.zero_labels, self._region_ptr, self._region_cells = label_zero_regions(self.adjacency)
+
+    def reveal(self, my_board, x, y):
+        return self.reveal_many(my_board, [x * my_board.shape[1] + y])
+
+    def reveal_many(self, my_board, targets):
+        # returns the flat indices opened; a zero opens its whole precomputed region at once
+        targets = np.asarray(targets, dtype=np.intp)
+        cells = self._regions(targets, self.zero_labels, self._region_ptr, self._region_cells)
+        if (my_board.flat[cells] == FLAG).any():
+            # flags stop a cascade, so the regions they cut into are labelled again without them
+            labels, region_ptr, region_cells = label_zero_regions(self.adjacency, my_board == FLAG)
+            cells = self._regions(targets, labels, region_ptr, region_cells)
+        cells = cells[my_board.flat[cells] == CLOSED]
+        my_board.flat[cells] = self.adjacency.flat[cells]
+        return cells
+
+    @staticmethod
+    def _regions(targets, labels, region_ptr, region_cells):
+        # the targets plus every region a zero target opens, as sorted flat indices
+        labels = labels.flat[targets]
+        parts = [targets[labels == 0]]
+        for label in np.unique(labels[labels > 0]):
+            parts.append(region_cells[region_ptr[label - 1]:region_ptr[label]])
+        return np.unique(np.concatenate(parts))
+
+    def toggle_flag(self, x, y):
+        pass    # flags are read straight from my_board
+
+    def explode(self, x, y):
+        pass
+
+    def fork(self):
+        return self     # nothing in here changes after construction
+
+    def sync(self, my_board):
+        pass
+
+    def constraint_arrays(self, my_board, cells=None):
+        return generate_constraint_arrays(my_board, cells)
+
+ENGINES = {"array": ArrayEngine, "bitboard": BitboardEngine}
 
 # --- Visualizer ---
 
@@ -95,6 +199,13 @@ class MinesweeperVisualizer:
             5: (128, 0, 0), 6: (0, 128, 128), 7: (0, 0, 0), 8: (128, 128, 128)
         }
 
+    def __getstate__(self):
+        # pygame handles can't be pickled into worker processes; they are reopened on the next frame
+        state = self.__dict__.copy()
+        for key in ("window", "clock", "cell_font", "header_font", "constraint_font", "flag_icon"):
+            state[key] = None
+        return state
+
     def _init_pygame(self):
         if 'pygame' not in sys.modules: return
         pygame.init()
@@ -114,7 +225,8 @@ class MinesweeperVisualizer:
         except:
             self.flag_icon = None
 
-    def render_frame(self, board_getter, camera_x, camera_y, score, status, constraints=None):
+    def render_frame(self, window, camera_x, camera_y, score, status, constraints=None):
+        # window: (view_height, view_width) array of cell values for the area at the camera
         if 'pygame' not in sys.modules: return
         if self.window is None:
             self._init_pygame()
@@ -132,10 +244,7 @@ class MinesweeperVisualizer:
         # Grid
         for r in range(self.view_height_cells):
             for c in range(self.view_width_cells):
-                world_x = camera_x + c
-                world_y = camera_y + r
-                
-                val = board_getter(world_y, world_x)
+                val = int(window[r, c])
                 
                 rect = pygame.Rect(c * self.cell_size, 
                                    r * self.cell_size + self.HEADER_HEIGHT, 
@@ -202,16 +311,32 @@ class MinesweeperVisualizer:
 class MinesweeperDiscreetEnv(gym.Env):
     metadata = {"render_modes": ["ansi", "human"], "render_fps": 10}
 
-    def __init__(self, board_size=10, num_mines=10, render_mode=None):
+    def __init__(self, board_size=10, num_mines=10, render_mode=None, copy=False, obs_dtype=int, backend="array",
+                 record_path=None):
+        if backend not in ENGINES:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {sorted(ENGINES)}")
         self.board_size = board_size
         self.num_mines = num_mines
+        self.copy = copy                                # False: observations alias my_board (the agents rely on it)
+        self.obs_dtype = obs_dtype                      # np.int8 is enough for -3..8 and 8x smaller
+        self.backend = backend                          # "array" or "bitboard" (boards up to 64 columns)
         self.board = None
-        self.my_board = np.ones((board_size, board_size), dtype=int) * CLOSED
+        self.adjacency = None
+        self._engine = None
+        self.my_board = np.full((board_size, board_size), CLOSED, dtype=obs_dtype)
+        self.action_mask = np.ones(board_size * board_size, dtype=bool)     # True while a cell is still CLOSED
         self.total_reward = 0
         self.flags_placed = 0
         self.game_over_status = None
         self.first_move_made = False
-        self.current_constraints = []
+        self.closed_count = board_size * board_size     # running counts, so the win check is O(1)
+        self.revealed_count = 0
+        self._constraint_store = {}                     # source cell (flat) -> (hidden cells, mines)
+        self._constraints = []
+        self._constraint_delta = ([], [], [])           # (added, changed, removed) source cells of last refresh
+        self._pending_cells = []                        # changed cells not yet folded into the store
+        # with record_path set, every game and action is appended to a replay log (see replay.py)
+        self.recorder = ReplayWriter(record_path, FIXED_ENV, (board_size, num_mines)) if record_path else None
         
         self.render_mode = render_mode
         self.visualizer = None
@@ -219,190 +344,810 @@ class MinesweeperDiscreetEnv(gym.Env):
             self.visualizer = MinesweeperVisualizer(board_size, board_size)
         
         self.action_space = spaces.Discrete(board_size * board_size)
-        self.observation_space = spaces.Box(low=-3, high=8, shape=(board_size, board_size), dtype=int)
+        self.observation_space = spaces.Box(low=-3, high=8, shape=(board_size, board_size), dtype=obs_dtype)
 
     def reset(self, seed=None, options=None):
+        if self.recorder is not None:
+            # a replay has to rebuild the same board, so a recorded game always gets a seed
+            if seed is None: seed = int(np.random.SeedSequence().entropy % 2**63)
+            self.recorder.reset(seed)
         super().reset(seed=seed)
-        self.my_board = np.ones((self.board_size, self.board_size), dtype=int) * CLOSED
+        self.my_board = np.full((self.board_size, self.board_size), CLOSED, dtype=self.obs_dtype)
+        self.action_mask = np.ones(self.board_size * self.board_size, dtype=bool)
         self.board = None
+        self.adjacency = None
+        self._engine = None
         self.total_reward = 0
         self.flags_placed = 0
         self.game_over_status = None
         self.first_move_made = False
-        self.current_constraints = []
-        return self.my_board, {}
+        self.closed_count = self.board_size * self.board_size
+        self.revealed_count = 0
+        self._constraint_store = {}
+        self._constraints = []
+        self._constraint_delta = ([], [], [])
+        self._pending_cells = []
+        return self._obs(), self._info()
+
+    def _obs(self):
+        return self.my_board.copy() if self.copy else self.my_board
+
+    def _info(self):
+        return {"action_mask": self.action_mask.copy() if self.copy else self.action_mask}
+
+    @property
+    def current_constraints(self):
+        # rebuilt lazily, so headless runs that never read it never pay for it, and put
+        # in order only when read after a change, so a step stays O(changed cells)
+        self._refresh_constraints()
+        if self._constraints is None:
+            # row-major order, same as a full generate_constraints pass
+            self._constraints = [self._constraint_store[k] for k in sorted(self._constraint_store)]
+        return self._constraints
+
+    @property
+    def constraint_delta(self):
+        # (added, changed, removed) source cells changed by the most recent action, empty after a no-op
+        self._refresh_constraints()
+        return self._constraint_delta
 
     def step(self, action):
         x = int(action / self.board_size)
         y = int(action % self.board_size)
+        if self.recorder is not None: self.recorder.reveal(x, y)
+        self._constraint_delta = ([], [], [])
         
         if not self.first_move_made:
-            self.first_move_made = True
-            self.board = place_mines_safely(self.board_size, self.num_mines, x, y)
+            self._start_game(x, y)
 
         if self.my_board[x,y] != CLOSED:
-            self.current_constraints = generate_constraints(self.my_board, self.board_size)
-            return self.my_board, -1, False, False, {}
+            return self._obs(), -1, False, False, self._info()
 
         if is_mine(self.board, x, y):
-            self.my_board[x,y] = MINE
-            self.game_over_status = "loss"
-            self.current_constraints = generate_constraints(self.my_board, self.board_size)
-            return self.my_board, -100, True, False, {}
+            self._explode(x, y)
+            return self._obs(), -100, True, False, self._info()
         
-        self._reveal(x, y)
-        self.current_constraints = generate_constraints(self.my_board, self.board_size)
+        self._open(self._engine.reveal(self.my_board, x, y))
 
-        if is_win(self.my_board, self.num_mines):
+        if self.revealed_count == self.board_size * self.board_size - self.num_mines:
             self.game_over_status = "win"
-            return self.my_board, 1000, True, False, {}
+            return self._obs(), 1000, True, False, self._info()
             
-        return self.my_board, 1, False, False, {}
+        return self._obs(), 1, False, False, self._info()
 
-    def _reveal(self, x, y):
-        if not is_valid(x, y, self.board_size): return
-        if self.my_board[x, y] != CLOSED: return
-        
-        mines = 0
-        for dx in [-1,0,1]:
-            for dy in [-1,0,1]:
-                if dx==0 and dy==0: continue
-                nx, ny = x+dx, y+dy
-                if is_valid(nx, ny, self.board_size) and is_mine(self.board, nx, ny):
-                    mines += 1
-        
-        self.my_board[x, y] = mines
-        if mines == 0:
-            for dx in [-1,0,1]:
-                for dy in [-1,0,1]:
-                    if dx!=0 or dy!=0: self._reveal(x+dx, y+dy)
+    def step_many(self, reveals=(), flags=()):
+        # flags then reveals as one move, one cascade and one constraint refresh; stops at the first
+        # mine. info["reveals_applied"] counts the safe reveals
+        if self.recorder is not None: self.recorder.batch(reveals, flags)
+        self._constraint_delta = ([], [], [])
+        return self._step_many(reveals, flags)
+
+    def _step_many(self, reveals, flags):
+        n = self.board_size
+        for x, y in flags:
+            if self.my_board[x, y] == CLOSED: self._toggle_flag(x, y)
+
+        targets = [x * n + y for x, y in reveals]
+        if targets and not self.first_move_made:
+            self._start_game(*divmod(targets[0], n))
+
+        reward = 0
+        terminated = False
+        safe_targets = []
+        seen = set()
+        for cell in targets:
+            if self.my_board.flat[cell] != CLOSED or cell in seen:
+                reward -= 1
+                continue
+            seen.add(cell)
+            if self.board.flat[cell] == MINE:
+                terminated = True
+                break
+            safe_targets.append(cell)
+
+        if safe_targets:
+            self._open(self._engine.reveal_many(self.my_board, safe_targets))
+            reward += len(safe_targets)
+        if terminated:
+            self._explode(*divmod(cell, n))
+            reward -= 100
+        elif self.revealed_count == n * n - self.num_mines:
+            self.game_over_status = "win"
+            terminated = True
+            reward += 1000
+
+        info = self._info()
+        info["reveals_applied"] = len(safe_targets)
+        return self._obs(), reward, terminated, False, info
+
+    def chord(self, x, y):
+        # reveal every closed neighbour of a number whose mines are all flagged
+        if self.recorder is not None: self.recorder.chord(x, y)
+        self._constraint_delta = ([], [], [])
+        value = self.my_board[x, y]
+        neighbors = [(x + dx, y + dy) for dx, dy in NEIGHBOR_OFFSETS if is_valid(x + dx, y + dy, self.board_size)]
+        flagged = sum(1 for r, c in neighbors if self.my_board[r, c] == FLAG)
+        if value <= 0 or flagged != value:
+            info = self._info()
+            info["reveals_applied"] = 0
+            return self._obs(), -1, False, False, info
+        return self._step_many([(r, c) for r, c in neighbors if self.my_board[r, c] == CLOSED], ())
+
+    def _start_game(self, x, y):
+        self.first_move_made = True
+        self.board = place_mines_safely(self.board_size, self.num_mines, x, y, self.np_random)
+        self._engine = ENGINES[self.backend](self.board)
+        self.adjacency = self._engine.adjacency
+        for fx, fy in np.argwhere(self.my_board == FLAG):   # flags placed before the first click
+            self._engine.toggle_flag(fx, fy)
+
+    def _explode(self, x, y):
+        self.my_board[x, y] = MINE
+        self._engine.explode(x, y)
+        self.action_mask[x * self.board_size + y] = False
+        self.closed_count -= 1
+        self.game_over_status = "loss"
+        self._pending_cells.append([x * self.board_size + y])
+
+    def _open(self, opened):
+        self.action_mask[opened] = False
+        self.closed_count -= len(opened)
+        self.revealed_count += len(opened)
+        self._pending_cells.append(opened)
+
+    def _refresh_constraints(self):
+        if not self._pending_cells: return
+        cells = np.concatenate(self._pending_cells)
+        self._pending_cells = []
+        self._update_constraints(cells)
+
+    def _update_constraints(self, cells):
+        # only the changed cells and their neighbours can gain, lose or alter a constraint
+        n = self.board_size
+        rows, cols = np.divmod(np.asarray(cells), n)
+        offsets = np.vstack([NEIGHBOR_OFFSETS, [(0, 0)]])
+        rows = (rows[:, None] + offsets[:, 0]).ravel()
+        cols = (cols[:, None] + offsets[:, 1]).ravel()
+        inside = (rows >= 0) & (rows < n) & (cols >= 0) & (cols < n)
+        dirty = np.unique(rows[inside] * n + cols[inside])
+
+        if self._engine is None:
+            sources, indices, indptr, rhs = generate_constraint_arrays(self.my_board, dirty)
+        else:
+            sources, indices, indptr, rhs = self._engine.constraint_arrays(self.my_board, dirty)
+        fresh = dict(zip(sources.tolist(), csr_to_constraints(indices, indptr, rhs, n)))
+
+        added, changed, removed = [], [], []
+        for cell in dirty.tolist():
+            old = self._constraint_store.get(cell)
+            new = fresh.get(cell)
+            if new is None:
+                if old is not None:
+                    del self._constraint_store[cell]
+                    removed.append(divmod(cell, n))
+            elif old is None:
+                self._constraint_store[cell] = new
+                added.append(divmod(cell, n))
+            elif old != new:
+                self._constraint_store[cell] = new
+                changed.append(divmod(cell, n))
+
+        self._constraint_delta = (added, changed, removed)
+        if added or changed or removed: self._constraints = None
 
     def toggle_flag(self, x, y):
         if not is_valid(x, y, self.board_size): return
+        if self.recorder is not None: self.recorder.flag(x, y)
+        self._constraint_delta = ([], [], [])
+        self._toggle_flag(x, y)
+        if self.render_mode == "human": self.render()
+
+    def _toggle_flag(self, x, y):
+        if self.my_board[x, y] in (CLOSED, FLAG) and self._engine is not None:
+            self._engine.toggle_flag(x, y)
         if self.my_board[x, y] == CLOSED:
             self.my_board[x, y] = FLAG
+            self.action_mask[x * self.board_size + y] = False
             self.flags_placed += 1
+            self.closed_count -= 1
+            self._pending_cells.append([x * self.board_size + y])
         elif self.my_board[x, y] == FLAG:
             self.my_board[x, y] = CLOSED
+            self.action_mask[x * self.board_size + y] = True
             self.flags_placed -= 1
-        self.current_constraints = generate_constraints(self.my_board, self.board_size)
-        if self.render_mode == "human": self.render()
+            self.closed_count += 1
+            self._pending_cells.append([x * self.board_size + y])
+
+    def snapshot(self):
+        # compact bytes: the boards as int8 plus counters and the rng state. The engine,
+        # action mask and constraints are rebuilt from the boards on restore
+        meta = {"board_size": self.board_size, "num_mines": self.num_mines, "total_reward": self.total_reward,
+                "flags_placed": self.flags_placed, "game_over_status": self.game_over_status,
+                "first_move_made": self.first_move_made, "closed_count": self.closed_count,
+                "revealed_count": self.revealed_count, "rng": rng_state(self._np_random)}
+        arrays = {"my_board": self.my_board.astype(np.int8)}
+        if self.board is not None: arrays["board"] = self.board.astype(np.int8)
+        return pack_state(meta, arrays)
+
+    def restore(self, data):
+        meta, arrays = unpack_state(data)
+        if meta["board_size"] != self.board_size:
+            raise ValueError(f"Snapshot is of a {meta['board_size']} board, this env is {self.board_size}")
+        # written into the existing arrays, observations alias them
+        self.my_board[:] = arrays["my_board"]
+        self.action_mask[:] = (self.my_board == CLOSED).ravel()
+        self.num_mines = meta["num_mines"]
+        self.total_reward = meta["total_reward"]
+        self.flags_placed = meta["flags_placed"]
+        self.game_over_status = meta["game_over_status"]
+        self.first_move_made = meta["first_move_made"]
+        self.closed_count = meta["closed_count"]
+        self.revealed_count = meta["revealed_count"]
+        self._np_random = make_rng(meta["rng"])
+        self.board = self.adjacency = self._engine = None
+        if "board" in arrays:
+            self.board = arrays["board"].astype(int)
+            self._engine = ENGINES[self.backend](self.board)
+            self._engine.sync(self.my_board)
+            self.adjacency = self._engine.adjacency
+        self._constraint_store = {}
+        self._constraints = []
+        self._constraint_delta = ([], [], [])
+        self._pending_cells = [np.arange(self.board_size * self.board_size)]
+
+    def fork(self):
+        # an independent headless copy for what-if play; the mine layout and engine tables are shared
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.render_mode = None
+        clone.visualizer = None
+        clone.recorder = None
+        clone.my_board = self.my_board.copy()
+        clone.action_mask = self.action_mask.copy()
+        if self._engine is not None: clone._engine = self._engine.fork()
+        clone._constraint_store = dict(self._constraint_store)
+        clone._pending_cells = list(self._pending_cells)
+        clone._np_random = make_rng(rng_state(self._np_random))
+        return clone
 
     def render(self):
         if self.render_mode == "human" and self.visualizer:
-            def getter(r, c):
-                if 0 <= r < self.board_size and 0 <= c < self.board_size:
-                    return self.my_board[r, c]
-                return CLOSED
-            self.visualizer.render_frame(getter, 0, 0, self.total_reward, self.game_over_status, self.current_constraints)
+            self.visualizer.render_frame(self.my_board, 0, 0, self.total_reward, self.game_over_status, self.current_constraints)
 
     def close(self):
         if self.visualizer: self.visualizer.close()
+        if self.recorder is not None: self.recorder.close()
+
+# --- Batched Fixed Env ---
+# K fixed-size boards stepped as one (K, H, W) array, with gymnasium's vector conventions:
+# finished boards reset on the next step (next-step autoreset), ignoring that step's action
+class MinesweeperVectorEnv(VectorEnv):
+    metadata = {"render_modes": [], "autoreset_mode": NEXT_STEP_AUTORESET}
+
+    def __init__(self, num_envs=8, board_size=10, num_mines=10, copy=True, obs_dtype=int):
+        if num_mines > board_size * board_size - 9:
+            raise ValueError(f"Cannot place {num_mines} mines on a {board_size}x{board_size} board outside the first click")
+        self.num_envs = num_envs
+        self.board_size = board_size
+        self.num_mines = num_mines
+        self.copy = copy
+        self.obs_dtype = obs_dtype
+        self.render_mode = None
+
+        self.single_action_space = spaces.Discrete(board_size * board_size)
+        self.single_observation_space = spaces.Box(low=-3, high=8, shape=(board_size, board_size), dtype=obs_dtype)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+
+        shape = (num_envs, board_size, board_size)
+        self.mines = np.zeros(shape, dtype=bool)
+        self.adjacency = np.zeros(shape, dtype=int)
+        self.my_board = np.full(shape, CLOSED, dtype=obs_dtype)
+        self.action_mask = np.ones((num_envs, board_size * board_size), dtype=bool)
+        self.first_move_made = np.zeros(num_envs, dtype=bool)
+        self.revealed_count = np.zeros(num_envs, dtype=int)
+        self._autoreset = np.zeros(num_envs, dtype=bool)
+
+    def reset(self, seed=None, options=None):
+        if isinstance(seed, (list, tuple)):
+            # gymnasium also takes one seed per board; one generator drives them all, seeded from the list
+            seed_seq = np.random.SeedSequence([s for s in seed if s is not None] or None)
+            self._np_random, self._np_random_seed = np.random.Generator(np.random.PCG64(seed_seq)), seed_seq.entropy
+        elif seed is not None:
+            self._np_random, self._np_random_seed = seeding.np_random(seed)
+        mask = np.ones(self.num_envs, dtype=bool)
+        if options and "reset_mask" in options:
+            mask = np.asarray(options["reset_mask"], dtype=bool)
+        self._reset_boards(mask)
+        return self._obs(), self._info()
+
+    def _reset_boards(self, mask):
+        self.mines[mask] = False
+        self.adjacency[mask] = 0
+        self.my_board[mask] = CLOSED
+        self.action_mask[mask] = True
+        self.first_move_made[mask] = False
+        self.revealed_count[mask] = 0
+        self._autoreset[mask] = False
+
+    def _obs(self):
+        return self.my_board.copy() if self.copy else self.my_board
+
+    def _info(self):
+        # every board reports a mask, hence the all-True "_action_mask" presence flags
+        mask = self.action_mask.copy() if self.copy else self.action_mask
+        return {"action_mask": mask, "_action_mask": np.ones(self.num_envs, dtype=bool)}
+
+    def _place_mines(self, envs, x, y):
+        # rejection-free: the num_mines smallest random keys among allowed cells, per board
+        n = self.board_size
+        rows, cols = np.divmod(np.arange(n * n), n)
+        forbidden = (np.abs(rows - x[:, None]) <= 1) & (np.abs(cols - y[:, None]) <= 1)
+        keys = self.np_random.random((len(envs), n * n))
+        keys[forbidden] = 2.0
+        picks = np.argpartition(keys, self.num_mines - 1, axis=1)[:, :self.num_mines]
+        mines = np.zeros((len(envs), n * n), dtype=bool)
+        mines[np.arange(len(envs))[:, None], picks] = True
+        mines = mines.reshape(len(envs), n, n)
+
+        padded = np.pad(mines, ((0, 0), (1, 1), (1, 1))).astype(int)
+        counts = sum(padded[:, 1 + dr:1 + dr + n, 1 + dc:1 + dc + n] for dr, dc in NEIGHBOR_OFFSETS)
+        self.mines[envs] = mines
+        self.adjacency[envs] = np.where(mines, MINE, counts)
+        self.first_move_made[envs] = True
+
+    def _cascade(self, envs, x, y):
+        # flood all the given boards at once by repeated 8-neighbour dilation of opened zeros
+        n = self.board_size
+        board = self.my_board[envs]
+        adjacency = self.adjacency[envs]
+        opened = np.zeros(board.shape, dtype=bool)
+        opened[np.arange(len(envs)), x, y] = True
+        frontier = opened & (adjacency == 0)
+        while frontier.any():
+            padded = np.pad(frontier, ((0, 0), (1, 1), (1, 1)))
+            grown = np.zeros_like(frontier)
+            for dr, dc in NEIGHBOR_OFFSETS:
+                grown |= padded[:, 1 + dr:1 + dr + n, 1 + dc:1 + dc + n]
+            grown &= (board == CLOSED) & ~opened
+            opened |= grown
+            frontier = grown & (adjacency == 0)
+        board[opened] = adjacency[opened]
+        self.my_board[envs] = board
+        self.action_mask[envs] &= ~opened.reshape(len(envs), -1)
+        return np.count_nonzero(opened, axis=(1, 2))
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=int)
+        rewards = np.zeros(self.num_envs, dtype=float)
+        terminations = np.zeros(self.num_envs, dtype=bool)
+        truncations = np.zeros(self.num_envs, dtype=bool)
+
+        restarting = self._autoreset.copy()
+        if restarting.any(): self._reset_boards(restarting)
+
+        x, y = np.divmod(actions, self.board_size)
+        envs = np.arange(self.num_envs)
+
+        first = ~restarting & ~self.first_move_made
+        if first.any():
+            self._place_mines(envs[first], x[first], y[first])
+
+        already_open = ~restarting & (self.my_board[envs, x, y] != CLOSED)
+        rewards[already_open] = -1
+
+        hit = ~restarting & ~already_open & self.mines[envs, x, y]
+        self.my_board[envs[hit], x[hit], y[hit]] = MINE
+        self.action_mask[envs[hit], actions[hit]] = False
+        rewards[hit] = -100
+        terminations[hit] = True
+
+        safe = ~restarting & ~already_open & ~hit
+        if safe.any():
+            self.revealed_count[safe] += self._cascade(envs[safe], x[safe], y[safe])
+            won = safe & (self.revealed_count == self.board_size * self.board_size - self.num_mines)
+            rewards[safe] = 1
+            rewards[won] = 1000
+            terminations[won] = True
+
+        self._autoreset = terminations | truncations
+        return self._obs(), rewards, terminations, truncations, self._info()
 
 # --- INFINITE CHUNK-BASED ENV ---
 class MinesweeperInfiniteEnv:
     CHUNK_SIZE = 16
     DENSITY = 0.15
 
-    def __init__(self, render_mode="human", view_w=20, view_h=15):
+    def __init__(self, render_mode="human", view_w=20, view_h=15, seed=None, max_resident_chunks=None, spill_path=None,
+                 prefetch=False, thread_safe=False, record_path=None):
         self.render_mode = render_mode
-        self.mines = set()
-        self.flags = set()
-        self.revealed = {} 
-        self.generated_chunks = set()
-        self.game_over_status = None
-        self.score = 0
+        if thread_safe and max_resident_chunks is not None:
+            raise ValueError("thread_safe does not work with max_resident_chunks, the spill store is single-threaded")
+        # (cr, cc) -> Chunk. With max_resident_chunks set, the least recently used chunks
+        # beyond that many are spilled to a memory-mapped file (spill_path, or a temp file)
+        self.max_resident_chunks = max_resident_chunks
+        if max_resident_chunks is None:
+            self._chunks = {}
+        else:
+            self._chunks = ChunkStore(max_resident_chunks, self._chunk_mines, self.CHUNK_SIZE, spill_path)
+        # with prefetch on, a background thread builds the chunks around every move's frontier
+        self._prefetcher = ChunkPrefetcher() if prefetch else None
+        # with thread_safe on, several threads can step and flag at once. Each move locks the
+        # chunks it writes to (in sorted order, so two moves never wait on each other), and
+        # _lock covers creating chunks, the first-click overlay and the counters.
+        # Not a speedup: under the GIL the moves still run one at a time, several walkers
+        # step no more cells per second than one (benchmarks.py), this only keeps them correct
+        self.thread_safe = thread_safe
+        self._lock = threading.RLock()
+        self._chunk_locks = {}
+        # set/dict-like views over the chunks, for code that probes single cells
+        self.revealed = RevealedView(self)
+        self.flags = FlagView(self)
+        self.mines = MineView(self)
         self.view_w = view_w
         self.view_h = view_h
         self.visualizer = None
         if self.render_mode == "human":
             self.visualizer = MinesweeperVisualizer(view_w, view_h)
+        # with record_path set, every world and action is appended to a replay log (see replay.py)
+        self.recorder = ReplayWriter(record_path, INFINITE_ENV) if record_path else None
+        self._np_random, _ = seeding.np_random(seed)
+        self.reset()
+
+    def __getstate__(self):
+        # locks and the prefetch thread can't be copied or pickled, the copy makes its own
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        state["_chunk_locks"] = {}
+        state["_prefetcher"] = self._prefetcher is not None
+        state["recorder"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        self._prefetcher = ChunkPrefetcher() if state["_prefetcher"] else None
+
+    @property
+    def generated_chunks(self):
+        return self._chunks.keys()
 
     def _get_chunk_coords(self, r, c):
         return r // self.CHUNK_SIZE, c // self.CHUNK_SIZE
 
-    def _generate_chunk(self, cr, cc, safe_r=None, safe_c=None):
-        if (cr, cc) in self.generated_chunks: return
-        for r in range(cr * self.CHUNK_SIZE, (cr + 1) * self.CHUNK_SIZE):
-            for c in range(cc * self.CHUNK_SIZE, (cc + 1) * self.CHUNK_SIZE):
-                if safe_r is not None and abs(r - safe_r) <= 1 and abs(c - safe_c) <= 1:
-                    continue
-                if random() < self.DENSITY:
-                    self.mines.add((r, c))
-        self.generated_chunks.add((cr, cc))
-
-    def _ensure_area_generated(self, r, c, safe_mode=False):
-        cr, cc = self._get_chunk_coords(r, c)
+    def _cell(self, r, c):
+        # the chunk holding (r, c) (None if not generated yet) and the local coordinates in it
+        cr, lr = divmod(r, self.CHUNK_SIZE)
+        cc, lc = divmod(c, self.CHUNK_SIZE)
+        return self._chunks.get((cr, cc)), lr, lc
+
+    def _layout(self):
+        # the current world's chunk layout as a pure function of (cr, cc), safe to hand to a worker.
+        # A subclass with its own _chunk_mines hands that over, so it has to be pure as well
+        if type(self)._chunk_mines is not MinesweeperInfiniteEnv._chunk_mines: return self._chunk_mines
+        world_seed, size, density, safe_cell = self.world_seed, self.CHUNK_SIZE, self.DENSITY, self.safe_cell
+        return lambda cr, cc: chunk_mines(world_seed, cr, cc, size, density, safe_cell)
+
+    def _chunk_mines(self, cr, cc):
+        # seeded layout of the chunk with the first-click safe zone laid over it
+        return chunk_mines(self.world_seed, cr, cc, self.CHUNK_SIZE, self.DENSITY, self.safe_cell)
+
+    def _generate_chunk(self, cr, cc):
+        if (cr, cc) in self._chunks: return
+        with self._lock:
+            if (cr, cc) in self._chunks: return
+            chunk = None
+            if self._prefetcher is not None: chunk = self._prefetcher.take((cr, cc))
+            if chunk is None: chunk = Chunk(self._chunk_mines(cr, cc))
+            self._chunks[(cr, cc)] = chunk
+
+    @contextmanager
+    def _locked(self, keys):
+        # holds the locks of the chunks in keys, taken in sorted order, and gives the set of them.
+        # Unless thread_safe it locks nothing and gives None: every chunk is fair game
+        if not self.thread_safe:
+            yield None
+            return
+        keys = sorted(set(keys))
+        locks = [self._chunk_locks.get(key) or self._chunk_locks.setdefault(key, threading.Lock()) for key in keys]
+        for lock in locks: lock.acquire()
+        try:
+            yield set(keys)
+        finally:
+            for lock in reversed(locks): lock.release()
+
+    def _prefetch_around(self, cells):
+        # queue every chunk within two of the chunks this move touched: the ones a cascade
+        # from here could open next, plus the rings their counts are built from.
+        # Each chunk only does this the first time a move touches it
+        size = self.CHUNK_SIZE
+        with self._lock:
+            touched = {(r // size, c // size) for r, c in cells} - self._prefetch_centers
+            if not touched: return
+            self._prefetch_centers |= touched
+        wanted = {(cr + dcr, cc + dcc) for cr, cc in touched for dcr in range(-2, 3) for dcc in range(-2, 3)}
+        self._prefetcher.request([key for key in wanted if key not in self._chunks], self._layout())
+
+    def _set_safe_cell(self, r, c):
+        # the 3x3 around the first click is mine-free; chunks built before it (by a flag) get the overlay now
+        with self._lock:
+            if self.safe_cell is not None: return
+            self.safe_cell = (r, c)
+            for cr, cc in {self._get_chunk_coords(r + dr, c + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)}:
+                if (cr, cc) in self._chunks:
+                    chunk = self._own(cr, cc)
+                    chunk.mines = chunk.mines & self._chunk_mines(cr, cc)
+
+    def _own(self, cr, cc):
+        # a chunk shared with a fork is swapped for a private copy before this env writes to it
+        chunk = self._chunks[(cr, cc)]
+        if chunk.shared:
+            chunk = chunk.copy()
+            self._chunks[(cr, cc)] = chunk
+        return chunk
+
+    def _prepare_chunk(self, cr, cc):
+        # generate the ring of chunks around (cr, cc) and fill in its neighbour counts.
+        # Runs once per chunk, after that a reveal inside it is a table lookup
+        ring = {}
         for dcr in [-1, 0, 1]:
             for dcc in [-1, 0, 1]:
-                if safe_mode and dcr == 0 and dcc == 0:
-                    self._generate_chunk(cr + dcr, cc + dcc, r, c)
-                else:
-                    self._generate_chunk(cr + dcr, cc + dcc)
+                self._generate_chunk(cr + dcr, cc + dcc)
+                ring[(dcr, dcc)] = self._chunks[(cr + dcr, cc + dcc)].mines
+        chunk = self._chunks[(cr, cc)]
+        counts = None
+        if self._prefetcher is not None: counts = self._prefetcher.take_counts((cr, cc))
+        chunk.counts = counts if counts is not None else neighbor_counts(ring)
+        return chunk
+
+    def _ready_chunk(self, cr, cc):
+        # the chunk, generated and with its counts
+        chunk = self._chunks.get((cr, cc))
+        if chunk is None or chunk.counts is None: chunk = self._prepare_chunk(cr, cc)
+        return chunk
+
+    def _ready_cell(self, r, c):
+        # like _cell, but the chunk is generated and has its counts
+        cr, lr = divmod(r, self.CHUNK_SIZE)
+        cc, lc = divmod(c, self.CHUNK_SIZE)
+        return self._ready_chunk(cr, cc), lr, lc
 
     def get_cell_value(self, r, c):
-        if (r, c) in self.revealed: return self.revealed[(r, c)]
-        if (r, c) in self.flags: return FLAG
-        return CLOSED
-
-    def reset(self):
-        self.mines.clear()
-        self.flags.clear()
-        self.revealed.clear()
-        self.generated_chunks.clear()
+        chunk, lr, lc = self._cell(r, c)
+        if chunk is None: return CLOSED
+        return int(chunk.visible[lr, lc])
+
+    def get_window(self, r0, c0, h, w):
+        # visible state of rows r0..r0+h-1, columns c0..c0+w-1 as one (h, w) int8 array,
+        # copied a chunk slice at a time; cells in chunks never generated read CLOSED
+        size = self.CHUNK_SIZE
+        window = np.full((h, w), CLOSED, dtype=np.int8)
+        for cr in range(r0 // size, (r0 + h - 1) // size + 1):
+            top, bottom = max(r0, cr * size), min(r0 + h, (cr + 1) * size)
+            for cc in range(c0 // size, (c0 + w - 1) // size + 1):
+                chunk = self._chunks.get((cr, cc))
+                if chunk is None: continue
+                left, right = max(c0, cc * size), min(c0 + w, (cc + 1) * size)
+                window[top - r0:bottom - r0, left - c0:right - c0] = \
+                    chunk.visible[top - cr * size:bottom - cr * size, left - cc * size:right - cc * size]
+        return window
+
+    def reset(self, seed=None, world_seed=None):
+        # every reset starts a new world; its layout is fixed by world_seed, drawn from the
+        # env's rng unless given (a replay passes the recorded one)
+        if seed is not None:
+            self._np_random, _ = seeding.np_random(seed)
+        self.world_seed = int(self._np_random.integers(2**63)) if world_seed is None else world_seed
+        if self.recorder is not None: self.recorder.reset(self.world_seed)
+        self.safe_cell = None
+        self._chunks.clear()
+        if self._prefetcher is not None: self._prefetcher.reset()
+        self._prefetch_centers = set()
+        self._chunk_locks.clear()
+        self.revealed_count = 0
+        self.flag_count = 0
         self.game_over_status = None
         self.score = 0
         return {}
 
+    def _trim(self):
+        if self.max_resident_chunks is not None: self._chunks.trim()
+
+    def _count(self, revealed=0, flags=0):
+        with self._lock:
+            self.revealed_count += revealed
+            self.flag_count += flags
+
     def step(self, r, c):
+        if self.recorder is not None: self.recorder.reveal(r, c)
+        self._trim()
         if self.game_over_status: return []
         
-        is_first_move = (len(self.revealed) == 0)
-        self._ensure_area_generated(r, c, safe_mode=is_first_move)
-
-        if (r, c) in self.flags: return []
-        
-        if (r, c) in self.mines:
-            self.revealed[(r, c)] = MINE
-            self.game_over_status = "loss"
-            self.score = len(self.revealed)
-            return []
-        
+        if self.safe_cell is None: self._set_safe_cell(r, c)
+        cr, cc = self._get_chunk_coords(r, c)
         newly_revealed = []
-        if (r, c) not in self.revealed:
-            self._reveal_recursive(r, c, newly_revealed)
+        # a cascade usually spills into the chunks next to the click, so they are locked up front
+        with self._locked([(cr + dcr, cc + dcc) for dcr in (-1, 0, 1) for dcc in (-1, 0, 1)]) as held:
+            chunk, lr, lc = self._ready_cell(r, c)
+            if chunk.visible[lr, lc] == FLAG: return []
+            
+            if chunk.mines[lr, lc]:
+                chunk = self._own(cr, cc)
+                chunk.visible[lr, lc] = MINE
+                self._count(revealed=1)
+                with self._lock:
+                    self.game_over_status = "loss"
+                    self.score = self.revealed_count
+                return []
+            
+            deferred = None
+            if chunk.visible[lr, lc] == CLOSED:
+                deferred = self._reveal_cascade(r, c, newly_revealed, held)
+        # the cascade reached chunks it had not locked: carry on there, a round of locks at a time
+        while deferred:
+            with self._locked(deferred) as held:
+                deferred = self._flood(deferred, newly_revealed, held)
+        if self._prefetcher is not None and newly_revealed:
+            self._prefetch_around(newly_revealed)
             
-        self.score = len(self.revealed)
+        self.score = self.revealed_count
         return newly_revealed
 
-    def _reveal_recursive(self, r, c, newly_revealed):
-        if (r, c) in self.revealed: return
-        
-        mine_count = 0
-        for dr in [-1, 0, 1]:
-            for dc in [-1, 0, 1]:
-                if dr==0 and dc==0: continue
-                if (r+dr, c+dc) in self.mines: mine_count += 1
-        
-        self.revealed[(r, c)] = mine_count
-        newly_revealed.append((r, c))
-        
-        if mine_count == 0:
-            for dr in [-1, 0, 1]:
-                for dc in [-1, 0, 1]:
-                    if dr==0 and dc==0: continue
-                    nr, nc = r+dr, c+dc
-                    self._ensure_area_generated(nr, nc)
-                    self._reveal_recursive(nr, nc, newly_revealed)
+    def _reveal_cascade(self, r, c, newly_revealed, held=None):
+        # opens (r, c), which must be closed, and the zero region behind it.
+        # Returns the flood seeds left over for chunks outside `held` (see _flood)
+        chunk, lr, lc = self._ready_cell(r, c)
+        if chunk.counts[lr, lc] != 0:
+            # a number opens just itself
+            chunk = self._own(*self._get_chunk_coords(r, c))
+            chunk.visible[lr, lc] = chunk.counts[lr, lc]
+            self._count(revealed=1)
+            newly_revealed.append((r, c))
+            return {}
+
+        size = self.CHUNK_SIZE
+        start = self._get_chunk_coords(r, c)
+        seeds = {start: np.zeros((size, size), dtype=bool)}
+        seeds[start][lr, lc] = True
+        return self._flood(seeds, newly_revealed, held)
+
+    def _flood(self, seeds, newly_revealed, held=None):
+        # flood a chunk at a time: flood_chunk fills one chunk, and the zeros it opens on the
+        # border seed the neighbouring chunks, which wait in a queue. Nothing recurses, so the
+        # size of a region is not bounded by the stack. With `held` given (the chunks this
+        # thread has locked) seeds for any other chunk are handed back instead of followed
+        size = self.CHUNK_SIZE
+        halo = halo_slices(size)
+        queue = deque(seeds)
+        deferred = {}
+        revealed = flags = 0
+        while queue:
+            key = queue.popleft()
+            if held is not None and key not in held:
+                mask = seeds.pop(key)
+                deferred[key] = deferred[key] | mask if key in deferred else mask
+                continue
+            cr, cc = key
+            chunk = self._ready_chunk(cr, cc)
+            opened, reach = flood_chunk(seeds.pop(key), chunk.visible <= CLOSED, chunk.counts == 0)
+            if not opened.any(): continue
+            chunk = self._own(cr, cc)
+
+            # a cascade opens flagged cells too, dropping the flag
+            flags -= int(np.count_nonzero(chunk.visible[opened] == FLAG))
+            chunk.visible[opened] = chunk.counts[opened]
+            rows, cols = np.nonzero(opened)
+            revealed += len(rows)
+            newly_revealed.extend(zip((rows + cr * size).tolist(), (cols + cc * size).tolist()))
+
+            for dcr, dcc in NEIGHBOR_OFFSETS:
+                (src_r, dst_r), (src_c, dst_c) = halo[dcr], halo[dcc]
+                edge = reach[dst_r, dst_c]
+                if not edge.any(): continue
+                key = (cr + dcr, cc + dcc)
+                if key not in seeds:
+                    seeds[key] = np.zeros((size, size), dtype=bool)
+                    queue.append(key)
+                seeds[key][src_r, src_c] |= edge
+        self._count(revealed, flags)
+        return deferred
 
     def toggle_flag(self, r, c):
-        if (r, c) in self.revealed: return
-        if (r, c) in self.flags: self.flags.remove((r, c))
-        else: self.flags.add((r, c))
+        if self.recorder is not None: self.recorder.flag(r, c)
+        self._trim()
+        self._generate_chunk(*self._get_chunk_coords(r, c))
+        with self._locked([self._get_chunk_coords(r, c)]):
+            chunk = self._own(*self._get_chunk_coords(r, c))
+            lr, lc = r % self.CHUNK_SIZE, c % self.CHUNK_SIZE
+            value = chunk.visible[lr, lc]
+            if value == FLAG:
+                chunk.visible[lr, lc] = CLOSED
+                self._count(flags=-1)
+            elif value == CLOSED:
+                chunk.visible[lr, lc] = FLAG
+                self._count(flags=1)
+
+    def memory_bytes(self):
+        # array storage held in memory by the chunk store, spilled chunks not included
+        chunks = self._chunks if self.max_resident_chunks is None else self._chunks.resident
+        return sum(chunk.nbytes() for chunk in chunks.values())
+
+    def snapshot(self):
+        # compact bytes: the seed, counters and the visible state of every chunk that has some.
+        # Mines and counts are rebuilt from the seed, chunks still all closed are kept as keys only
+        size = self.CHUNK_SIZE
+        touched, untouched = [], []
+        for key, chunk in self._chunks.items():
+            if (chunk.visible != CLOSED).any(): touched.append((key, chunk))
+            else: untouched.append((key, chunk))
+        keys = np.array([key for key, _ in touched + untouched], dtype=np.int64).reshape(-1, 2)
+        visible = np.array([chunk.visible for _, chunk in touched], dtype=np.int8).reshape(-1, size, size)
+        meta = {"chunk_size": size, "world_seed": self.world_seed, "safe_cell": self.safe_cell,
+                "touched": len(touched), "revealed_count": self.revealed_count, "flag_count": self.flag_count,
+                "game_over_status": self.game_over_status, "score": self.score, "rng": rng_state(self._np_random)}
+        return pack_state(meta, {"keys": keys, "visible": visible})
+
+    def restore(self, data):
+        meta, arrays = unpack_state(data)
+        if meta["chunk_size"] != self.CHUNK_SIZE:
+            raise ValueError(f"Snapshot has {meta['chunk_size']}-cell chunks, this env uses {self.CHUNK_SIZE}")
+        self._chunks.clear()
+        if self._prefetcher is not None: self._prefetcher.reset()
+        self._prefetch_centers = set()
+        self._chunk_locks.clear()
+        self._np_random = make_rng(meta["rng"])
+        self.world_seed = meta["world_seed"]
+        self.safe_cell = None if meta["safe_cell"] is None else tuple(meta["safe_cell"])
+        self.revealed_count = meta["revealed_count"]
+        self.flag_count = meta["flag_count"]
+        self.game_over_status = meta["game_over_status"]
+        self.score = meta["score"]
+        for i, (cr, cc) in enumerate(arrays["keys"].tolist()):
+            chunk = Chunk(self._chunk_mines(cr, cc))
+            if i < meta["touched"]: chunk.visible[:] = arrays["visible"][i]
+            self._chunks[(cr, cc)] = chunk
+
+    def fork(self):
+        # an independent headless copy for what-if play, without spill store, prefetch or locks.
+        # Chunks are shared copy-on-write: forking costs a dict copy, and whichever env
+        # writes to a shared chunk first swaps in its own copy (see _own)
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone._chunks = dict(self._chunks.items())
+        for chunk in clone._chunks.values(): chunk.shared = True
+        clone.render_mode = None
+        clone.visualizer = None
+        clone.max_resident_chunks = None
+        clone._prefetcher = None
+        clone._prefetch_centers = set()
+        clone.thread_safe = False
+        clone.recorder = None
+        clone._lock = threading.RLock()
+        clone._chunk_locks = {}
+        clone._np_random = make_rng(rng_state(self._np_random))
+        clone.revealed = RevealedView(clone)
+        clone.flags = FlagView(clone)
+        clone.mines = MineView(clone)
+        return clone
 
     def render(self, camera_x, camera_y):
         if self.visualizer:
-            self.visualizer.render_frame(self.get_cell_value, camera_x, camera_y, self.score, self.game_over_status, [])
+            window = self.get_window(camera_y, camera_x, self.view_h, self.view_w)
+            self.visualizer.render_frame(window, camera_x, camera_y, self.score, self.game_over_status, [])
 
     def close(self):
-        if self.visualizer: self.visualizer.close()
\ No newline at end of file
+        if self.visualizer: self.visualizer.close()
+        if self.recorder is not None: self.recorder.close()
+        if self.max_resident_chunks is not None: self._chunks.close()
+        if self._prefetcher is not None: self._prefetcher.close()
+
+# --- Gymnasium Registration ---
+# gym.make("Minesweeper-v0") builds a headless env unless render_mode="human" is passed;
+# gym.make_vec("Minesweeper-v0", vectorization_mode="vector_entry_point") gives the batched env
+if "Minesweeper-v0" not in gym.registry:
+    gym.register(
+        id="Minesweeper-v0",
+        entry_point="minesweeper:MinesweeperDiscreetEnv",
+        vector_entry_point="minesweeper:MinesweeperVectorEnv",
+        kwargs={"board_size": DEFAULT_BOARD_SIZE, "num_mines": 10, "copy": True},
+    )
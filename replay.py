@@ -0,0 +1,177 @@
+import sys
+import time
+
+# Replay logs: an append-only file holding a short header, then one record per game start
+# (with the seed that rebuilds its board) and one per action. Every number is a varint,
+# coordinates zigzag-encoded so the infinite world's negative ones stay small: a reveal
+# or flag near the origin takes 3 bytes. Run `python replay.py game.msr [game] [steps]`
+# to re-execute a recorded game headlessly.
+
+MAGIC = b"MSR1"
+
+FIXED_ENV, INFINITE_ENV = 0, 1              # env kind, in the header
+RESET, REVEAL, FLAG, BATCH, CHORD = range(5)
+
+def _uvarint(n):
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+def _zigzag(n):
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+def _unzigzag(n):
+    return n >> 1 if not n & 1 else -(n >> 1) - 1
+
+def _read_uvarint(data, pos):
+    # returns (value, next position); IndexError past the end of data
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80: return result, pos
+        shift += 7
+
+def _header(kind, params):
+    return MAGIC + _uvarint(kind) + _uvarint(len(params)) + b"".join(_uvarint(p) for p in params)
+
+class ReplayWriter:
+    # the envs own one of these when built with record_path. Several games (and several env
+    # instances one after another) can append to the same file as long as the header matches
+    def __init__(self, path, kind, params=()):
+        header = _header(kind, params)
+        self.path = path
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._write(header)
+        else:
+            with open(path, "rb") as f:
+                if f.read(len(header)) != header:
+                    self._file.close()
+                    raise ValueError(f"{path} holds games of a different env")
+
+    def _write(self, record):
+        # flushed per record, so a process killed without close() still leaves every action on disk
+        self._file.write(record)
+        self._file.flush()
+
+    def _cell(self, op, r, c):
+        self._write(_uvarint(op) + _uvarint(_zigzag(int(r))) + _uvarint(_zigzag(int(c))))
+
+    def reset(self, seed):
+        self._write(_uvarint(RESET) + _uvarint(int(seed)))
+
+    def reveal(self, r, c):
+        self._cell(REVEAL, r, c)
+
+    def flag(self, r, c):
+        self._cell(FLAG, r, c)
+
+    def chord(self, r, c):
+        self._cell(CHORD, r, c)
+
+    def batch(self, reveals, flags):
+        cells = [int(v) for cell in list(reveals) + list(flags) for v in cell]
+        self._write(_uvarint(BATCH) + _uvarint(len(reveals)) + _uvarint(len(flags))
+                    + b"".join(_uvarint(_zigzag(v)) for v in cells))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def read_replay(path):
+    # returns (kind, params, games), each game a (seed, actions) pair and each action
+    # (op, args). A record cut off by a crash at the end of the file is dropped
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != MAGIC: raise ValueError(f"{path} is not a replay log")
+    pos = 4
+    kind, pos = _read_uvarint(data, pos)
+    count, pos = _read_uvarint(data, pos)
+    params = []
+    for _ in range(count):
+        value, pos = _read_uvarint(data, pos)
+        params.append(value)
+
+    games = []
+    while pos < len(data):
+        try:
+            op, pos = _read_uvarint(data, pos)
+            if op == RESET:
+                seed, pos = _read_uvarint(data, pos)
+                games.append((seed, []))
+                continue
+            if op == BATCH:
+                reveals, pos = _read_uvarint(data, pos)
+                flags, pos = _read_uvarint(data, pos)
+                values = []
+                for _ in range(2 * (reveals + flags)):
+                    value, pos = _read_uvarint(data, pos)
+                    values.append(_unzigzag(value))
+                cells = list(zip(values[0::2], values[1::2]))
+                args = (cells[:reveals], cells[reveals:])
+            else:
+                r, pos = _read_uvarint(data, pos)
+                c, pos = _read_uvarint(data, pos)
+                args = (_unzigzag(r), _unzigzag(c))
+        except IndexError:
+            break
+        if not games: raise ValueError(f"{path} has actions before the first game starts")
+        games[-1][1].append((op, args))
+    return kind, params, games
+
+class Replay:
+    def __init__(self, path):
+        self.path = path
+        self.kind, self.params, self.games = read_replay(path)
+
+    def make_env(self):
+        # headless, and not recording itself
+        from minesweeper import MinesweeperDiscreetEnv, MinesweeperInfiniteEnv
+        if self.kind == FIXED_ENV:
+            board_size, num_mines = self.params
+            return MinesweeperDiscreetEnv(board_size=board_size, num_mines=num_mines)
+        return MinesweeperInfiniteEnv(render_mode=None)
+
+    def play(self, game=0, steps=None, env=None):
+        # re-executes game `game` up to action `steps` (all of it by default) and returns the env
+        seed, actions = self.games[game]
+        if env is None: env = self.make_env()
+        if self.kind == FIXED_ENV:
+            env.reset(seed=seed)
+            n = env.board_size
+            for op, args in actions[:steps]:
+                if op == REVEAL: env.step(args[0] * n + args[1])
+                elif op == FLAG: env.toggle_flag(*args)
+                elif op == BATCH: env.step_many(*args)
+                elif op == CHORD: env.chord(*args)
+        else:
+            env.reset(world_seed=seed)
+            for op, args in actions[:steps]:
+                if op == REVEAL: env.step(*args)
+                elif op == FLAG: env.toggle_flag(*args)
+        return env
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python replay.py <log> [game] [steps]")
+        sys.exit(1)
+    replay = Replay(sys.argv[1])
+    games = [int(sys.argv[2])] if len(sys.argv) > 2 else range(len(replay.games))
+    steps = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    for game in games:
+        env = replay.make_env()
+        start = time.perf_counter()
+        replay.play(game, steps, env)
+        elapsed = time.perf_counter() - start
+        actions = len(replay.games[game][1]) if steps is None else min(steps, len(replay.games[game][1]))
+        score = env.score if replay.kind == INFINITE_ENV else env.revealed_count
+        print(f"game {game}: {actions} actions, score {score}, status {env.game_over_status}, "
+              f"{elapsed * 1000:.1f} ms ({actions / max(elapsed, 1e-9):.0f} actions/s)")
+        env.close()
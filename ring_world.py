@@ -0,0 +1,16 @@
+import numpy as np
+from minesweeper import MinesweeperInfiniteEnv
+
+# infinite env for the tests and benchmarks: a single square ring of mines at Chebyshev
+# distance `radius` from the origin, so clicking (0, 0) opens the whole (2 * radius - 1)^2 inside
+
+class RingWorld(MinesweeperInfiniteEnv):
+    def __init__(self, radius=10, **kwargs):
+        self.radius = radius
+        super().__init__(**kwargs)
+
+    def _chunk_mines(self, cr, cc):
+        size = self.CHUNK_SIZE
+        r = np.arange(cr * size, (cr + 1) * size)[:, None]
+        c = np.arange(cc * size, (cc + 1) * size)[None, :]
+        return np.maximum(abs(r), abs(c)) == self.radius
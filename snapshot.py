@@ -0,0 +1,40 @@
+import json
+import struct
+import numpy as np
+
+# Binary env snapshots: a 4-byte header length, a JSON header holding the small metadata
+# and the name/dtype/shape of every array, then the raw array bytes back to back.
+# No pickle, so a snapshot can be loaded from anywhere without running code
+
+MAGIC = b"MSS1"
+
+def pack_state(meta, arrays):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    header = {"meta": meta, "arrays": [[name, array.dtype.str, list(array.shape)] for name, array in arrays.items()]}
+    # numpy scalars (e.g. a reward summed from env outputs) go in as plain numbers
+    encoded = json.dumps(header, default=lambda value: value.item()).encode()
+    return b"".join([MAGIC, struct.pack("<I", len(encoded)), encoded] + [array.tobytes() for array in arrays.values()])
+
+def unpack_state(data):
+    # returns (meta, {name: array}); the arrays are read-only views into data
+    if data[:4] != MAGIC: raise ValueError("Not an env snapshot")
+    (length,) = struct.unpack_from("<I", data, 4)
+    header = json.loads(data[8:8 + length])
+    arrays = {}
+    offset = 8 + length
+    for name, dtype, shape in header["arrays"]:
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape)
+        offset += count * dtype.itemsize
+    return header["meta"], arrays
+
+def rng_state(rng):
+    # JSON-friendly state of a numpy Generator (None stays None)
+    return None if rng is None else rng.bit_generator.state
+
+def make_rng(state):
+    if state is None: return None
+    rng = np.random.Generator(getattr(np.random, state["bit_generator"])())
+    rng.bit_generator.state = state
+    return rng
@@ -1,7 +1,19 @@
 # code to run tests, all from https://minesweeper.online/help/patterns
+import os
+import tempfile
+import time
+import threading
 import numpy as np
-from constants import CLOSED, FLAG
-from agent_eval import solve_csp
+import gymnasium as gym
+from constants import CLOSED, FLAG, MINE
+import itertools
+from agent_eval import solve_csp, backtracking_solve, count_solutions
+import agent
+import agent_inf_balanced
+from constraints import generate_constraints, generate_constraint_arrays, reduce_constraints, linear_deductions, split_components, guess_probabilities
+from minesweeper import MinesweeperDiscreetEnv, MinesweeperVectorEnv, MinesweeperInfiniteEnv, count_adjacent_mines
+from replay import Replay
+from ring_world import RingWorld
 
 
 # run a bunch of trivial test cases to see if the agent logic is sound
@@ -408,6 +420,797 @@ def h3():
     assert expected == safe_moves, ("Wrong, expected result is", expected)
     print("PASSED TEST\n")
 
+def test_constraint_arrays():
+    board = np.array([
+        [CLOSED, 1, CLOSED],
+        [1, FLAG, 1],
+        [CLOSED, 2, CLOSED]
+    ])
+
+    print("\nTEST: CSR constraints match the list format")
+    print_board(board)
+
+    sources, indices, indptr, rhs = generate_constraint_arrays(board)
+    constraints = generate_constraints(board, 3)
+
+    print("Constraints:", constraints)
+    assert list(sources) == [1, 3, 5, 7], ("Wrong sources", sources)
+    assert list(indptr) == [0, 2, 4, 6, 8], ("Wrong offsets", indptr)
+    assert list(rhs) == [0, 0, 0, 1], ("Wrong rhs", rhs)
+    assert constraints[3] == ([(2, 0), (2, 2)], 1), ("Wrong constraint", constraints[3])
+    for i, (cells, mines) in enumerate(constraints):
+        flat = [r * 3 + c for r, c in cells]
+        assert flat == list(indices[indptr[i]:indptr[i + 1]]), ("Mismatch at", i)
+    print("PASSED TEST\n")
+
+def test_incremental_constraints():
+    print("\nTEST: env constraint store matches a full rebuild")
+
+    rng = np.random.default_rng(7)
+    env = MinesweeperDiscreetEnv(board_size=8, num_mines=10)
+    env.reset()
+    done = False
+    while not done:
+        closed = np.argwhere(env.my_board == CLOSED)
+        if len(closed) == 0: break
+        r, c = closed[rng.integers(len(closed))]
+        if rng.random() < 0.3:
+            env.toggle_flag(r, c)
+        else:
+            _, _, done, _, _ = env.step(r * env.board_size + c)
+        expected = generate_constraints(env.my_board, env.board_size)
+        assert env.current_constraints == expected, ("Store out of sync after", (r, c))
+
+    # a move that changes nothing hands back an empty delta, not the previous move's again
+    env = MinesweeperDiscreetEnv(board_size=8, num_mines=10)
+    env.reset(seed=3)
+    env.step(0)
+    assert env.constraint_delta[0], "First click added no constraints"
+    env.step(0)
+    assert env.constraint_delta == ([], [], []), "No-op step repeated the last delta"
+    env.toggle_flag(-1, 0)
+    assert env.constraint_delta == ([], [], []), "Invalid flag repeated the last delta"
+    print("PASSED TEST\n")
+
+def test_seeded_mine_placement():
+    print("\nTEST: same seed gives the same board")
+
+    boards = []
+    for seed in [11, 11, 12]:
+        env = MinesweeperDiscreetEnv(board_size=9, num_mines=70)
+        env.reset(seed=seed)
+        env.step(4 * 9 + 4)
+        boards.append(env.board.copy())
+
+    assert (boards[0] == boards[1]).all(), "Same seed gave different boards"
+    assert not (boards[0] == boards[2]).all(), "Different seeds gave the same board"
+    assert np.count_nonzero(boards[0] == -1) == 70, "Wrong number of mines"
+    assert not (boards[0][3:6, 3:6] == -1).any(), "Mine placed next to the first click"
+    print("PASSED TEST\n")
+
+def test_vector_env():
+    print("\nTEST: vector env steps and auto-resets every board")
+
+    envs = MinesweeperVectorEnv(num_envs=16, board_size=6, num_mines=8)
+    obs, info = envs.reset(seed=3)
+    assert obs.shape == (16, 6, 6) and (obs == CLOSED).all(), "Reset boards should be closed"
+
+    obs, rewards, terminations, truncations, info = envs.step(np.full(16, 14))
+    assert (rewards > 0).all(), ("First click must be safe", rewards)
+    assert (obs[:, 2, 2] == 0).all(), "First click should open a zero"
+
+    rng = np.random.default_rng(3)
+    for _ in range(200):
+        done_before = terminations
+        obs, rewards, terminations, truncations, info = envs.step(rng.integers(0, 36, 16))
+        assert ((obs[done_before] == CLOSED).all()), "Finished boards should auto-reset"
+        assert (rewards[done_before] == 0).all(), "Auto-reset step should give no reward"
+
+    # a seed per board, as gymnasium vector envs take them, gives the same boards every time
+    layouts = []
+    for _ in range(2):
+        envs.reset(seed=list(range(16)))
+        envs.step(np.full(16, 14))
+        layouts.append(envs.mines.copy())
+    assert (layouts[0] == layouts[1]).all(), "Same seed list should give the same boards"
+    print("PASSED TEST\n")
+
+def test_async_vector_env():
+    print("\nTEST: registered env runs in AsyncVectorEnv with shared memory")
+
+    envs = gym.make_vec("Minesweeper-v0", num_envs=2, vectorization_mode="async",
+                        vector_kwargs={"shared_memory": True}, board_size=6, num_mines=5)
+    try:
+        obs, info = envs.reset(seed=0)
+        assert obs.shape == (2, 6, 6), ("Wrong batch shape", obs.shape)
+        obs, rewards, terminations, truncations, info = envs.step(np.array([14, 21]))
+        assert (rewards > 0).all(), ("First click must be safe", rewards)
+        assert (obs >= 0).any(axis=(1, 2)).all(), "Workers did not write observations back"
+    finally:
+        envs.close()
+    print("PASSED TEST\n")
+
+def test_step_many_and_chord():
+    print("\nTEST: batched reveals and chording")
+
+    env = MinesweeperDiscreetEnv(board_size=8, num_mines=10)
+    env.reset(seed=4)
+    env.step(0)
+    mines = [tuple(m) for m in np.argwhere(env.board == -1)]
+    safe = [tuple(c) for c in np.argwhere((env.board != -1) & (env.my_board == CLOSED))]
+
+    # flag everything, then chord every number: no mine may be hit
+    obs, reward, done, truncated, info = env.step_many(flags=mines)
+    assert env.flags_placed == 10 and info["reveals_applied"] == 0, "Flags not applied"
+    for r, c in np.argwhere(env.my_board > 0):
+        obs, reward, done, truncated, info = env.chord(r, c)
+        assert env.game_over_status != "loss", "Chord hit a mine"
+
+    # whatever is left opens in one call and wins
+    remaining = [c for c in safe if env.my_board[c] == CLOSED]
+    if remaining:
+        obs, reward, done, truncated, info = env.step_many(remaining)
+        assert info["reveals_applied"] == len(remaining), ("Wrong count", info)
+    assert env.game_over_status == "win", "Board should be solved"
+    print("PASSED TEST\n")
+
+def test_infinite_chunk_store():
+    print("\nTEST: infinite env chunk storage")
+
+    env = MinesweeperInfiniteEnv(render_mode=None)
+    opened = env.step(5, -7)
+    assert opened and env.game_over_status is None, "First click must be safe"
+    assert len(env.revealed) == env.score == len(opened), "Revealed count out of sync"
+    for r, c in opened:
+        assert (r, c) in env.revealed and (r, c) not in env.mines
+        assert env.revealed[(r, c)] == env.get_cell_value(r, c)
+        mines = sum((r + dr, c + dc) in env.mines for dr in (-1, 0, 1) for dc in (-1, 0, 1))
+        assert env.revealed[(r, c)] == mines, "Wrong neighbour count"
+
+    # flags live in the chunks too, including chunks nobody has stepped in yet
+    env.toggle_flag(1000, 1000)
+    assert (1000, 1000) in env.flags and env.get_cell_value(1000, 1000) == FLAG
+    env.toggle_flag(1000, 1000)
+    assert len(env.flags) == 0 and (1000, 1000) not in env.flags
+    assert env.memory_bytes() <= 8 * 256 * len(env.generated_chunks), "Chunks should be small arrays"
+    print("PASSED TEST\n")
+
+def test_seeded_infinite_world():
+    print("\nTEST: seeded infinite world generation")
+
+    # same seed and first click -> same world, whatever order the chunks get built in
+    a = MinesweeperInfiniteEnv(render_mode=None, seed=11)
+    b = MinesweeperInfiniteEnv(render_mode=None, seed=11)
+    a.step(3, 3)
+    b.toggle_flag(3, 3); b.toggle_flag(3, 3)     # builds the first chunk before the safe zone exists
+    b.toggle_flag(-200, 90)                      # and one far away, out of order
+    b.step(3, 3)
+    for cell in [(3, 3), (-200, 90), (40, -41)]:
+        a.toggle_flag(*cell); b.toggle_flag(*cell)
+    for key in a.generated_chunks:
+        assert (a._chunks[key].mines == b._chunks[key].mines).all(), ("Chunk differs", key)
+    assert not any((3 + dr, 3 + dc) in b.mines for dr in (-1, 0, 1) for dc in (-1, 0, 1)), "Safe zone missing"
+
+    # a dropped chunk comes back bit-for-bit, a new reset gives a new world
+    layout = a._chunks[(-13, 5)].mines.copy()
+    del a._chunks[(-13, 5)]
+    a._generate_chunk(-13, 5)
+    assert (a._chunks[(-13, 5)].mines == layout).all(), "Regenerated chunk differs"
+    seed = a.world_seed
+    a.reset()
+    assert a.world_seed != seed and len(a.generated_chunks) == 0
+    print("PASSED TEST\n")
+
+def test_spill_store():
+    print("\nTEST: infinite env with a bounded chunk cache")
+
+    a = MinesweeperInfiniteEnv(render_mode=None, seed=2)
+    b = MinesweeperInfiniteEnv(render_mode=None, seed=2, max_resident_chunks=3)
+    rng = np.random.default_rng(0)
+    for r, c in rng.integers(-60, 60, size=(400, 2)):
+        r, c = int(r), int(c)
+        if (r, c) in a.mines: a.toggle_flag(r, c); b.toggle_flag(r, c)
+        else: assert a.step(r, c) == b.step(r, c), "Cascades differ"
+    b.step(0, 0)
+    assert len(b._chunks.resident) <= 3 + 9, "Cache not trimmed"
+    assert dict(a.revealed) == dict(b.revealed) and set(a.flags) == set(b.flags), "Spilled state lost"
+    assert all(b.revealed[cell] == a.get_cell_value(*cell) for cell in a.revealed)
+    a.close(); b.close()
+    print("PASSED TEST\n")
+
+def test_large_cascade():
+    print("\nTEST: infinite env opens a 100k+ cell region in one click")
+
+    # one ring of mines around the origin, everything inside it is one zero region
+    env = RingWorld(radius=170, render_mode=None, seed=0)
+    env.toggle_flag(30, -40)
+    opened = env.step(0, 0)
+    assert len(opened) == len(set(opened)) == 339 ** 2 == env.score, ("Wrong region size", len(opened))
+    assert len(env.flags) == 0, "Cascade should open flagged cells"
+    assert env.get_cell_value(169, 0) == 3 and env.get_cell_value(168, 0) == 0
+    assert env.get_cell_value(170, 0) == CLOSED and env.get_cell_value(-169, -169) == 5
+    print("PASSED TEST\n")
+
+def test_get_window():
+    print("\nTEST: infinite env window query")
+
+    env = MinesweeperInfiniteEnv(render_mode=None, seed=7)
+    env.step(0, 0)
+    env.toggle_flag(-30, 25)
+    window = env.get_window(-37, -20, 50, 61)     # spans generated and never-generated chunks
+    assert window.shape == (50, 61) and window.dtype == np.int8
+    expected = [[env.get_cell_value(r, c) for c in range(-20, 41)] for r in range(-37, 13)]
+    assert (window == np.array(expected)).all(), "Window differs from per-cell reads"
+    inside = [cell for cell in env.revealed if -37 <= cell[0] < 13 and -20 <= cell[1] < 41]
+    assert window[-30 + 37, 25 + 20] == FLAG and (window >= 0).sum() == len(inside)
+    print("PASSED TEST\n")
+
+def test_chunk_prefetch():
+    print("\nTEST: infinite env background chunk prefetching")
+
+    plain = MinesweeperInfiniteEnv(render_mode=None, seed=5)
+    env = MinesweeperInfiniteEnv(render_mode=None, seed=5, prefetch=True)
+    try:
+        assert env.step(0, 0) == plain.step(0, 0)
+        deadline = time.time() + 5
+        while not env._prefetcher.ready and time.time() < deadline: time.sleep(0.01)
+        assert env._prefetcher.ready, "Nothing was prefetched"
+
+        # adopted chunks are the ones the env would have built itself
+        rng = np.random.default_rng(1)
+        for r, c in rng.integers(-40, 40, size=(300, 2)):
+            r, c = int(r), int(c)
+            if (r, c) in plain.mines: continue
+            assert env.step(r, c) == plain.step(r, c), "Prefetched world differs"
+        assert dict(env.revealed) == dict(plain.revealed)
+
+        # a reset drops everything built for the old world
+        env.reset(seed=6)
+        assert not env._prefetcher.ready and not env._prefetcher.counts
+    finally:
+        env.close()
+
+    # a subclass's layout is the one the prefetcher builds too
+    plain = RingWorld(radius=40, render_mode=None, seed=5)
+    env = RingWorld(radius=40, render_mode=None, seed=5, prefetch=True)
+    try:
+        assert env.step(0, 0) == plain.step(0, 0)
+        deadline = time.time() + 5
+        while len(env._prefetcher.ready) < 50 and time.time() < deadline: time.sleep(0.01)
+        # only inside the ring: outside it the world has no mines and a click floods forever
+        for r, c in np.random.default_rng(2).integers(-39, 40, size=(100, 2)):
+            r, c = int(r), int(c)
+            assert env.step(r, c) == plain.step(r, c), "Prefetched ring world differs"
+    finally:
+        env.close()
+
+    # a long strip walk east: chunks that are never adopted go stale, the buffers stay
+    # small and prefetching still runs at the far end
+    env = MinesweeperInfiniteEnv(render_mode=None, seed=7, prefetch=True)
+    prefetcher = env._prefetcher
+    prefetcher.max_age, prefetcher.max_ready = 8, 48
+    try:
+        env.step(0, 0)
+        largest = 0
+        for c in range(1000):
+            for r in range(16):
+                if (r, c) not in env.revealed and (r, c) not in env.mines: env.step(r, c)
+            largest = max(largest, len(prefetcher.ready), len(prefetcher.counts))
+            assert set(prefetcher.counts) <= set(prefetcher._published)
+        assert largest <= 48 + 25, f"Prefetch buffer grew to {largest}"
+        deadline = time.time() + 5
+        while not any(cc >= 999 // 16 for _, cc in prefetcher.ready) and time.time() < deadline: time.sleep(0.01)
+        assert any(cc >= 999 // 16 for _, cc in prefetcher.ready), "Prefetching stopped"
+    finally:
+        env.close()
+    print("PASSED TEST\n")
+
+def test_shared_infinite_world():
+    print("\nTEST: infinite env shared by several threads")
+
+    def run_threads(target, jobs):
+        threads = [threading.Thread(target=target, args=(job,)) for job in jobs]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+    # eight clicks into the same region at once: it crosses 64 chunks, and opens exactly once
+    env = RingWorld(radius=60, render_mode=None, seed=0, thread_safe=True)
+    env.toggle_flag(-20, 35)
+    results = []
+    run_threads(lambda cell: results.append(env.step(*cell)), [(i * 7 - 25, 30 - i * 8) for i in range(8)])
+    opened = [cell for cells in results for cell in cells]
+    assert len(opened) == len(set(opened)) == 119 ** 2 == env.revealed_count, ("Region opened wrong", len(opened))
+    assert env.flag_count == 0 and len(env.flags) == 0
+
+    # threads clicking and flagging around the same area end up where one thread would
+    rng = np.random.default_rng(3)
+    jobs = [[(int(r), int(c)) for r, c in rng.integers(-50, 50, size=(150, 2))] for _ in range(6)]
+    shared = MinesweeperInfiniteEnv(render_mode=None, seed=2, thread_safe=True)
+    plain = MinesweeperInfiniteEnv(render_mode=None, seed=2)
+
+    def play(env, cells):
+        for r, c in cells:
+            env._generate_chunk(*env._get_chunk_coords(r, c))
+            if (r, c) in env.mines: env.toggle_flag(r, c)
+            else: env.step(r, c)
+
+    for world in (shared, plain): world.step(0, 0)
+    run_threads(lambda cells: play(shared, cells), jobs)
+    for cells in jobs: play(plain, cells)
+    assert (shared.get_window(-70, -70, 140, 140) == plain.get_window(-70, -70, 140, 140)).all()
+    assert shared.revealed_count == plain.revealed_count == len(shared.revealed)
+    assert shared.flag_count == len(shared.flags)
+    print("PASSED TEST\n")
+
+def test_snapshot_and_fork():
+    print("\nTEST: snapshot, restore and fork")
+
+    def safe_cells(env, count, rng):
+        cells = np.argwhere(env.board != -1)
+        return [tuple(int(v) for v in cells[i]) for i in rng.choice(len(cells), count, replace=False)]
+
+    for backend in ("array", "bitboard"):
+        env = MinesweeperDiscreetEnv(board_size=16, num_mines=40, backend=backend)
+        env.reset(seed=4)
+        env.step(8 * 16 + 8)
+        env.toggle_flag(0, 0)
+        data = env.snapshot()
+        assert isinstance(data, bytes) and len(data) < 1024, len(data)
+
+        # a fork and a restored env play on exactly like the original
+        fork = env.fork()
+        restored = MinesweeperDiscreetEnv(board_size=16, num_mines=40, backend=backend)
+        restored.restore(data)
+        moves = safe_cells(env, 20, np.random.default_rng(0))
+        for other in (fork, restored):
+            assert other.visualizer is None and (other.my_board == env.my_board).all()
+            for r, c in moves: other.step(r * 16 + c)
+        assert (fork.my_board == restored.my_board).all() and fork.revealed_count == restored.revealed_count
+        assert fork.current_constraints == restored.current_constraints
+        for r, c in moves: env.step(r * 16 + c)
+        assert (env.my_board == fork.my_board).all() and env.current_constraints == fork.current_constraints
+
+    env = MinesweeperInfiniteEnv(render_mode=None, seed=3)
+    env.step(0, 0)
+    env.toggle_flag(5, -30)
+    rng = np.random.default_rng(2)
+    moves = []
+    for r, c in rng.integers(-40, 40, size=(200, 2)):
+        env._generate_chunk(*env._get_chunk_coords(int(r), int(c)))
+        if (int(r), int(c)) not in env.mines: moves.append((int(r), int(c)))
+    data = env.snapshot()
+    fork = env.fork()
+    for r, c in moves: fork.step(r, c)
+    assert env.snapshot() == data, "Playing the fork changed the original"
+
+    restored = MinesweeperInfiniteEnv(render_mode=None)
+    restored.restore(data)
+    assert (restored.get_window(-50, -50, 100, 100) == env.get_window(-50, -50, 100, 100)).all()
+    for r, c in moves: assert restored.step(r, c) == env.step(r, c)
+    assert (env.get_window(-50, -50, 100, 100) == fork.get_window(-50, -50, 100, 100)).all()
+    assert env.revealed_count == fork.revealed_count == restored.revealed_count
+    print("PASSED TEST\n")
+
+def test_replay_log():
+    print("\nTEST: replay logs re-execute recorded games")
+
+    with tempfile.TemporaryDirectory() as folder:
+        # two fixed-board games from two envs appended to one log, using every kind of action
+        path = os.path.join(folder, "fixed.msr")
+        boards = []
+        for game in range(2):
+            env = MinesweeperDiscreetEnv(board_size=9, num_mines=10, record_path=path)
+            env.reset()
+            env.step(4 * 9 + 4)
+            safe = [tuple(cell) for cell in np.argwhere((env.board != -1) & (env.my_board == CLOSED))]
+            mines = [tuple(cell) for cell in np.argwhere(env.board == -1)]
+            env.toggle_flag(*mines[0])
+            env.step_many(safe[:3], mines[1:3])
+            numbers = np.argwhere(env.my_board > 0)
+            env.chord(*numbers[0])
+            env.step(int(safe[-1][0]) * 9 + int(safe[-1][1]))
+            boards.append(env.my_board.copy())
+            env.close()
+        replay = Replay(path)
+        assert len(replay.games) == 2
+        for game in range(2):
+            assert (replay.play(game).my_board == boards[game]).all(), "Fixed-board replay differs"
+
+        # an infinite game, replayed in full and up to a given step
+        path = os.path.join(folder, "infinite.msr")
+        env = MinesweeperInfiniteEnv(render_mode=None, record_path=path)
+        env.step(0, 0)
+        rng = np.random.default_rng(5)
+        middle = None
+        for i, (r, c) in enumerate(rng.integers(-30, 30, size=(80, 2))):
+            r, c = int(r), int(c)
+            env._generate_chunk(*env._get_chunk_coords(r, c))
+            if (r, c) in env.mines: env.toggle_flag(r, c)
+            else: env.step(r, c)
+            if i == 39: middle = env.get_window(-40, -40, 80, 80)
+        final = env.get_window(-40, -40, 80, 80)
+        env.close()
+        replay = Replay(path)
+        assert len(replay.games[0][1]) == 81
+        assert (replay.play().get_window(-40, -40, 80, 80) == final).all(), "Infinite replay differs"
+        assert (replay.play(steps=41).get_window(-40, -40, 80, 80) == middle).all(), "Seek went wrong"
+
+        # the log is on disk as it is written, before close (a process killed mid-game)
+        path = os.path.join(folder, "open.msr")
+        env = MinesweeperDiscreetEnv(board_size=9, num_mines=10, record_path=path)
+        env.reset(seed=1)
+        env.step(4 * 9 + 4)
+        env.toggle_flag(0, 0)
+        assert len(Replay(path).games[0][1]) == 2, "Actions not written before close"
+        env.close()
+
+        # a log cut off mid-record (a crash) still loads, without the broken action
+        path = os.path.join(folder, "infinite.msr")
+        with open(path, "rb") as f: data = f.read()
+        with open(path, "wb") as f: f.write(data[:-1])
+        assert len(Replay(path).games[0][1]) == 80
+    print("PASSED TEST\n")
+
+def test_backtracking_solutions():
+    print("\nTEST: backtracking_solve finds exactly the valid assignments")
+
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        # a random component: 8 cells, 5 overlapping constraints taken from a hidden layout
+        cells = [(0, i) for i in range(8)]
+        layout = rng.integers(0, 2, size=8)
+        constraints = []
+        for _ in range(5):
+            members = sorted(rng.choice(8, size=int(rng.integers(2, 5)), replace=False).tolist())
+            constraints.append(([cells[i] for i in members], int(layout[members].sum())))
+
+        expected = []
+        for values in itertools.product([0, 1], repeat=8):
+            if all(sum(values[cells.index(v)] for v in v_list) == limit for v_list, limit in constraints):
+                expected.append(dict(zip(cells, values)))
+        used = {v for v_list, _ in constraints for v in v_list}
+        expected = {tuple(sorted((v, value) for v, value in sol.items() if v in used)) for sol in expected}
+        for solve in (backtracking_solve, agent.backtracking_solve):
+            found = {tuple(sorted(sol.items())) for sol in solve(sorted(used), constraints)}
+            assert found == expected, "Wrong solution set"
+    print("PASSED TEST\n")
+
+def test_count_only_solve():
+    print("\nTEST: count-only solving matches the enumerated solutions")
+
+    rng = np.random.default_rng(1)
+    for _ in range(40):
+        cells = [(0, i) for i in range(10)]
+        layout = rng.integers(0, 2, size=10)
+        constraints = []
+        for _ in range(6):
+            members = sorted(rng.choice(10, size=int(rng.integers(2, 5)), replace=False).tolist())
+            constraints.append(([cells[i] for i in members], int(layout[members].sum())))
+        used = sorted({v for v_list, _ in constraints for v in v_list})
+
+        solutions = backtracking_solve(list(used), constraints)
+        for count in (count_solutions, agent.count_solutions):
+            total, mine_counts, histogram, capped = count(list(used), constraints)
+            assert not capped
+            assert total == len(solutions) == sum(n for n, _ in histogram.values())
+            assert all(mine_counts[v] == sum(sol[v] for sol in solutions) for v in used)
+            for k, (n, counts) in histogram.items():
+                with_k = [sol for sol in solutions if sum(sol.values()) == k]
+                assert n == len(with_k) and all(counts[v] == sum(sol[v] for sol in with_k) for v in used)
+
+        # the infinite agents' solver, on the same component in its index form
+        index = {v: i for i, v in enumerate(used)}
+        local = [(limit, [index[v] for v in v_list]) for v_list, limit in constraints]
+        tuples = agent_inf_balanced.solve_component_smart(used, local)
+        total, counts, histogram = agent_inf_balanced.solve_component_smart(used, local, count_only=True)
+        assert total == len(tuples) and counts == [sum(t[i] for t in tuples) for i in range(len(used))]
+        assert sum(histogram.values()) == total
+
+    # both solve_csp paths agree on a real board
+    env = MinesweeperDiscreetEnv(board_size=16, num_mines=40)
+    env.reset(seed=11)
+    env.step(8 * 16 + 8)
+    assert solve_csp(env.my_board) == solve_csp(env.my_board, count_only=False)
+
+    # and on boards whose component hits the solution cap: neither path trusts a partial search
+    for seed in range(5):
+        rng = np.random.default_rng(seed)
+        board = np.zeros((12, 12), dtype=int)
+        board.flat[rng.choice(144, size=25, replace=False)] = MINE
+        adjacency = count_adjacent_mines(board)
+        my_board = np.full((12, 12), CLOSED)
+        shown = np.zeros((12, 12), dtype=bool)
+        shown[1::2, 1::2] = True
+        shown &= board != MINE
+        my_board[shown] = adjacency[shown]
+        residual = linear_deductions(reduce_constraints(generate_constraints(my_board, 12))[2])[2]
+        assert any(count_solutions(list(v), c)[3] for v, c in split_components(residual)), "Expected the search to hit its cap"
+        for solve in (solve_csp, agent.solve_csp):
+            found_safe, found_mines = solve(my_board, count_only=False)
+            assert (found_safe, found_mines) == solve(my_board)
+            assert all(board[cell] != MINE for cell in found_safe) and all(board[cell] == MINE for cell in found_mines)
+    print("PASSED TEST\n")
+
+def test_mine_probabilities():
+    print("\nTEST: exact mine probabilities with the global mine count")
+
+    checked = 0
+    for seed in range(30):
+        env = MinesweeperDiscreetEnv(board_size=6, num_mines=7)
+        env.reset(seed=seed)
+        env.step(2 * 6 + 2)
+        closed = [tuple(cell) for cell in np.argwhere(env.my_board == CLOSED)]
+        if env.game_over_status or len(closed) > 16: continue
+
+        # brute force: every placement of the 7 mines on the closed cells that fits the numbers
+        totals = np.zeros(env.my_board.shape)
+        layouts = 0
+        for mines in itertools.combinations(closed, 7):
+            board = np.zeros(env.my_board.shape, dtype=bool)
+            board[tuple(np.array(mines).T)] = True
+            padded = np.pad(board, 1).astype(int)
+            counts = sum(padded[1 + dr:7 + dr, 1 + dc:7 + dc] for dr in (-1, 0, 1) for dc in (-1, 0, 1)) - board
+            numbers = env.my_board >= 0
+            if (counts[numbers] == env.my_board[numbers]).all():
+                totals += board
+                layouts += 1
+
+        probabilities = guess_probabilities(env.my_board, 7, count_solutions)
+        is_closed = env.my_board == CLOSED
+        assert np.isnan(probabilities[~is_closed]).all()
+        assert np.allclose(probabilities[is_closed], totals[is_closed] / layouts), "Probabilities are not exact"
+        checked += 1
+    assert checked >= 5
+
+    # big boards stay finite and the probabilities add up to the mines left
+    env = MinesweeperDiscreetEnv(board_size=64, num_mines=800)
+    env.reset(seed=2)
+    env.step(32 * 64 + 32)
+    probabilities = guess_probabilities(env.my_board, 800, count_solutions)
+    assert np.isfinite(probabilities[env.my_board == CLOSED]).all()
+    assert abs(np.nansum(probabilities) - 800) < 1e-6
+    print("PASSED TEST\n")
+
+def test_constraint_reduction():
+    print("\nTEST: subset/difference deductions before the search")
+
+    # 1-1 along a wall: the third cell is safe
+    safe, mines, leftover = reduce_constraints([([(0, 0), (0, 1)], 1), ([(0, 0), (0, 1), (0, 2)], 1)])
+    assert safe == {(0, 2)} and not mines
+
+    # 1-2-1: the cells under the 1s are mines, the middle ones safe
+    row = [(1, c) for c in range(4)]
+    safe, mines, leftover = reduce_constraints([(row[:2], 1), (row[:3], 2), (row[1:], 2), (row[2:], 1)])
+    assert safe == {(1, 0), (1, 3)} and mines == {(1, 1), (1, 2)} and not leftover
+
+    # deduction plus search finds exactly the cells the search alone finds
+    checked = 0
+    for seed in range(40):
+        env = MinesweeperDiscreetEnv(board_size=12, num_mines=24)
+        env.reset(seed=seed)
+        env.step(6 * 12 + 6)
+        if env.game_over_status: continue
+        searched = set()
+        capped = False
+        for comp_vars, comp_constraints in split_components(generate_constraints(env.my_board, 12)):
+            solutions = backtracking_solve(comp_vars, comp_constraints)
+            capped = capped or len(solutions) > 1000 # not a full answer to compare against
+            searched |= {(v, solutions[0][v]) for v in comp_vars if all(s[v] == solutions[0][v] for s in solutions)}
+        if capped: continue
+        stats = {"deduction": 0, "linear": 0, "search": 0}
+        safe, mines = solve_csp(env.my_board, stats=stats)
+        assert {(v, 0) for v in safe} | {(v, 1) for v in mines} == searched, "Deduction changed the result"
+        assert stats["deduction"] + stats["linear"] + stats["search"] == len(searched)
+        checked += 1
+    assert checked >= 10
+    print("PASSED TEST\n")
+
+def test_linear_deductions():
+    print("\nTEST: Gaussian elimination over the constraint matrix")
+
+    # a+b+c = 2, c+d = 1, a+b+d = 1: no constraint lies inside another, but the first minus
+    # the third plus the second gives 2c = 2
+    cells = [(0, 0), (0, 1), (0, 2), (0, 3)]
+    a, b, c, d = cells
+    rules = [([a, b, c], 2), ([c, d], 1), ([a, b, d], 1)]
+    assert reduce_constraints(rules)[:2] == (set(), set())
+    safe, mines, left = linear_deductions(rules)
+    assert safe == {d} and mines == {c} and left == [([a, b], 1), ([a, b], 1)]
+
+    # never wrong: every deduction holds in every layout that fits, on random small systems
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        n = int(rng.integers(2, 10))
+        truth = rng.random(n) < 0.35
+        rules = []
+        for _ in range(int(rng.integers(1, n + 1))):
+            picked = rng.choice(n, size=int(rng.integers(1, n + 1)), replace=False).tolist()
+            rules.append(([(0, j) for j in picked], int(truth[picked].sum())))
+        layouts = [x for x in itertools.product((0, 1), repeat=n)
+                   if all(sum(x[j] for _, j in cells) == rhs for cells, rhs in rules)]
+        safe, mines, _ = linear_deductions(rules)
+        assert all(x[j] == 0 for x in layouts for _, j in safe), "Wrong safe cell"
+        assert all(x[j] == 1 for x in layouts for _, j in mines), "Wrong mine"
+
+    # a frontier far too big to enumerate: deductions still come, and match the real mines
+    env = MinesweeperDiscreetEnv(board_size=48, num_mines=480)
+    env.reset(seed=3)
+    env.step(24 * 48 + 24)
+    for cell in rng.permutation(np.flatnonzero(env.board.ravel() != MINE))[:150]:
+        if env.my_board.flat[cell] == CLOSED: env.step(int(cell))
+    _, _, residual = reduce_constraints(generate_constraints(env.my_board, 48))
+    assert max(len(comp_vars) for comp_vars, _ in split_components(residual)) > 40
+    safe, mines, _ = linear_deductions(residual)
+    assert safe and mines
+    assert all(env.board[cell] != MINE for cell in safe) and all(env.board[cell] == MINE for cell in mines)
+    print("PASSED TEST\n")
+
+def test_flags_stop_cascade():
+    print("\nTEST: flagged cells are barriers for a cascade")
+
+    for backend in ("array", "bitboard"):
+        walled_off = 0
+        for seed in range(10):
+            env = MinesweeperDiscreetEnv(board_size=10, num_mines=3, backend=backend)
+            env.reset(seed=seed)
+            for r in range(10): env.toggle_flag(r, 5)     # a wall of (mostly wrong) flags
+            env.step(4 * 10 + 2)
+            if env.game_over_status: continue
+
+            # the cascade as the original recursive reveal ran it: stop at anything not closed
+            expected = np.zeros((10, 10), dtype=bool)
+            stack = [(4, 2)]
+            while stack:
+                r, c = stack.pop()
+                if not (0 <= r < 10 and 0 <= c < 10) or expected[r, c] or c == 5: continue
+                expected[r, c] = True
+                if env.adjacency[r, c] == 0:
+                    stack.extend((r + dr, c + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1))
+            assert np.array_equal(env.my_board >= 0, expected), f"{backend}: cascade went past the flags"
+            assert (env.my_board[:, 5] == FLAG).all()
+            walled_off += not (env.my_board[:, 6:] >= 0).any()
+        assert walled_off > 0
+
+        # unflagging opens the rest of the region on the next click
+        env.toggle_flag(4, 5)
+        if env.adjacency[4, 5] == 0 and not env.game_over_status:
+            env.step(4 * 10 + 5)
+            assert (env.my_board[:, 6:] >= 0).any()
+    print("PASSED TEST\n")
+
+def test_bitboard_backend():
+    print("\nTEST: bitboard backend plays exactly like the array backend")
+
+    rng = np.random.default_rng(1)
+    for size, mines in ((9, 10), (16, 40), (30, 150), (64, 600)):
+        for seed in range(3):
+            envs = [MinesweeperDiscreetEnv(board_size=size, num_mines=mines, backend=backend) for backend in ("array", "bitboard")]
+            for env in envs: env.reset(seed=seed)
+            start = int(rng.integers(size * size))
+            for env in envs: env.step(start)
+            safe = np.flatnonzero(envs[0].board.ravel() != MINE)
+            for _ in range(60):
+                if envs[0].game_over_status: break
+                # same random move on both: a reveal, a flag toggle, a batch or a chord. Reveals
+                # go to safe cells (mostly) so the games last, flags anywhere
+                kind = rng.integers(4)
+                picks = np.append(rng.choice(safe, size=2), rng.integers(size * size))
+                if rng.random() < 0.05: picks[0] = rng.integers(size * size)
+                cells = [tuple(int(v) for v in divmod(int(a), size)) for a in picks]
+                for env in envs:
+                    if kind == 0: env.step(cells[0][0] * size + cells[0][1])
+                    elif kind == 1: env.toggle_flag(*cells[0])
+                    elif kind == 2: env.step_many(cells[:2], cells[2:])
+                    else: env.chord(*cells[0])
+
+                array_env, bit_env = envs
+                assert np.array_equal(array_env.my_board, bit_env.my_board), "Boards differ"
+                assert (array_env.revealed_count, array_env.closed_count, array_env.flags_placed) == \
+                       (bit_env.revealed_count, bit_env.closed_count, bit_env.flags_placed)
+                assert array_env.game_over_status == bit_env.game_over_status
+                if array_env._engine is None: continue
+                # full extraction and a partial one from an arbitrary cell set
+                for cells in (None, rng.choice(size * size, size=size, replace=False)):
+                    expected = generate_constraint_arrays(array_env.my_board, cells)
+                    got = bit_env._engine.constraint_arrays(bit_env.my_board, cells)
+                    assert all(np.array_equal(a, b) for a, b in zip(expected, got)), "Constraint arrays differ"
+                assert array_env.current_constraints == bit_env.current_constraints
+    print("PASSED TEST\n")
+
+def test_capped_probabilities():
+    print("\nTEST: guess probabilities when a component hits the solution cap")
+
+    # numbers on every other cell of every other row: one tangled component of ~70 cells
+    rng = np.random.default_rng(0)
+    board = np.zeros((12, 12), dtype=int)
+    board.flat[rng.choice(144, size=25, replace=False)] = MINE
+    adjacency = count_adjacent_mines(board)
+    my_board = np.full((12, 12), CLOSED)
+    shown = np.zeros((12, 12), dtype=bool)
+    shown[1::2, 1::2] = True
+    shown &= board != MINE
+    my_board[shown] = adjacency[shown]
+
+    safe, mines, residual = reduce_constraints(generate_constraints(my_board, 12))
+    for count in (count_solutions, agent.count_solutions):
+        capped = [count(list(comp_vars), comp_constraints)[3] for comp_vars, comp_constraints in split_components(residual)]
+        assert any(capped), "Expected the search to hit its cap"
+
+    # the cap is reported, so the answer is an estimate: still a probability per closed
+    # cell, deductions still exact, and the mines add up
+    probabilities = guess_probabilities(my_board, 25, count_solutions)
+    closed = my_board == CLOSED
+    assert np.isnan(probabilities[~closed]).all()
+    assert ((probabilities[closed] >= 0) & (probabilities[closed] <= 1)).all()
+    assert all(probabilities[cell] == 0 for cell in safe) and all(probabilities[cell] == 1 for cell in mines)
+    assert abs(np.nansum(probabilities) - 25) < 1e-6
+
+    # and solve_csp proves nothing from a capped tally
+    found_safe, found_mines = solve_csp(my_board)
+    assert all(board[cell] != MINE for cell in found_safe) and all(board[cell] == MINE for cell in found_mines)
+    print("PASSED TEST\n")
+
+def test_obs_dtype_and_action_mask():
+    print("\nTEST: int8 observations and the action mask")
+
+    rng = np.random.default_rng(3)
+    env = MinesweeperDiscreetEnv(board_size=12, num_mines=20, obs_dtype=np.int8)
+    assert env.observation_space.dtype == np.int8
+    for seed in range(3):
+        obs, info = env.reset(seed=seed)
+        assert obs.dtype == np.int8 and env.observation_space.contains(obs)
+        assert np.array_equal(info["action_mask"], (obs == CLOSED).ravel()), "Mask wrong after reset"
+        for _ in range(15):
+            if rng.random() < 0.3:
+                env.toggle_flag(*(int(v) for v in rng.integers(12, size=2)))
+                obs, info, done = env._obs(), env._info(), False
+            else:
+                obs, reward, done, truncated, info = env.step(int(rng.integers(144)))
+            assert obs.dtype == np.int8 and env.observation_space.contains(obs)
+            assert np.array_equal(info["action_mask"], (obs == CLOSED).ravel()), "Mask out of step with the board"
+            if done: break
+
+    # the batched env: one mask row per board, through autoresets too
+    envs = MinesweeperVectorEnv(num_envs=4, board_size=8, num_mines=10, obs_dtype=np.int8)
+    obs, info = envs.reset(seed=0)
+    for _ in range(20):
+        assert obs.dtype == np.int8 and envs.observation_space.contains(obs)
+        assert np.array_equal(info["action_mask"], (obs == CLOSED).reshape(4, -1))
+        obs, rewards, terminations, truncations, info = envs.step(rng.integers(64, size=4))
+    print("PASSED TEST\n")
+
+def test_counters_and_lazy_constraints():
+    print("\nTEST: running counters and lazy constraints against a full recount")
+
+    rng = np.random.default_rng(4)
+    for seed in range(4):
+        env = MinesweeperDiscreetEnv(board_size=14, num_mines=30)
+        env.reset(seed=seed)
+        env.step(7 * 14 + 7)
+        flagged = []
+        for move in range(80):
+            if env.game_over_status: break
+            safe = np.flatnonzero((env.board.ravel() != MINE) & (env.my_board.ravel() == CLOSED))
+            kind = rng.integers(5)
+            if kind == 0 and len(safe): env.step(int(rng.choice(safe)))
+            elif kind == 1:
+                cell = tuple(int(v) for v in rng.integers(14, size=2))
+                env.toggle_flag(*cell)
+                flagged.append(cell)
+            elif kind == 2 and flagged: env.toggle_flag(*flagged.pop(int(rng.integers(len(flagged)))))   # unflag
+            elif kind == 3 and len(safe): env.step_many([divmod(int(c), 14) for c in rng.choice(safe, size=min(3, len(safe)))])
+            else: env.chord(*(int(v) for v in rng.integers(14, size=2)))
+
+            board = env.my_board
+            assert env.revealed_count == np.count_nonzero(board >= 0), "Revealed counter drifted"
+            assert env.closed_count == np.count_nonzero(board == CLOSED), "Closed counter drifted"
+            assert env.flags_placed == np.count_nonzero(board == FLAG), "Flag counter drifted"
+            # read the constraints only now and then, so several changes pile up between refreshes
+            if move % 3 == 0:
+                assert env.current_constraints == generate_constraints(board, 14), "Lazy constraints are stale"
+        assert env.current_constraints == generate_constraints(env.my_board, 14)
+    print("PASSED TEST\n")
+
 if __name__ == "__main__":
     # global flagTests
     # global safeTests
@@ -441,6 +1244,32 @@ if __name__ == "__main__":
     run_test("H1 Test", h1, "safe")
     run_test("H2 Test", h2, "safe")
     run_test("H3 Test", h3, "safe")
+
+    run_test("Constraint Arrays", test_constraint_arrays, None)
+    run_test("Incremental Constraints", test_incremental_constraints, None)
+    run_test("Seeded Mine Placement", test_seeded_mine_placement, None)
+    run_test("Vector Env", test_vector_env, None)
+    run_test("Async Vector Env", test_async_vector_env, None)
+    run_test("Step Many And Chord", test_step_many_and_chord, None)
+    run_test("Infinite Chunk Store", test_infinite_chunk_store, None)
+    run_test("Seeded Infinite World", test_seeded_infinite_world, None)
+    run_test("Spill Store", test_spill_store, None)
+    run_test("Large Cascade", test_large_cascade, None)
+    run_test("Get Window", test_get_window, None)
+    run_test("Chunk Prefetch", test_chunk_prefetch, None)
+    run_test("Shared Infinite World", test_shared_infinite_world, None)
+    run_test("Snapshot And Fork", test_snapshot_and_fork, None)
+    run_test("Replay Log", test_replay_log, None)
+    run_test("Backtracking Solutions", test_backtracking_solutions, None)
+    run_test("Count Only Solve", test_count_only_solve, None)
+    run_test("Mine Probabilities", test_mine_probabilities, None)
+    run_test("Constraint Reduction", test_constraint_reduction, None)
+    run_test("Linear Deductions", test_linear_deductions, None)
+    run_test("Flags Stop Cascade", test_flags_stop_cascade, None)
+    run_test("Bitboard Backend", test_bitboard_backend, None)
+    run_test("Capped Probabilities", test_capped_probabilities, None)
+    run_test("Obs Dtype And Action Mask", test_obs_dtype_and_action_mask, None)
+    run_test("Counters And Lazy Constraints", test_counters_and_lazy_constraints, None)
     
 
     